@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+"""Timing and regression harness for the imprint parsers in update_printed_books.
+
+extract_place (MARC 260 $a), extract_publisher_name (260 $b) and extract_date
+(008 with 260 $c) are chains of regular expressions, easy to slow down and
+easy to break. This script runs them over a frozen fixture of real input and
+checks the results against a snapshot of their outputs, so a rework of any
+parser can be shown to be both faster and output-identical.
+
+    ../artefacts/imprint-parsers/fixture.json    every 260 $a, $b, $c and 008
+                                                 in the ESTC download, in STC
+                                                 order, repeats included
+    ../artefacts/imprint-parsers/snapshot.json   each parser's output for each
+                                                 fixture value, in the same order
+
+--freeze writes both from the current download and the current parsers; it is
+run once, and again only when the download changes. --snapshot rewrites the
+snapshot alone, for when a parser's output is meant to change: review its diff
+before committing it. A plain run times every parser (best of --rounds) and
+reports any value whose output no longer matches the snapshot, exiting with
+status 1 if there is one.
+
+Usage:
+    python3 bench_imprint_parsers.py --freeze     # build fixture + snapshot
+    python3 bench_imprint_parsers.py              # time and check
+    python3 bench_imprint_parsers.py --snapshot   # accept the current outputs
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import estc_store
+import marc
+import update_printed_books as upb
+
+FIXTURE_DIR = Path("../artefacts/imprint-parsers")
+FIXTURE_FILE = FIXTURE_DIR / "fixture.json"
+SNAPSHOT_FILE = FIXTURE_DIR / "snapshot.json"
+
+# Per-parser wiring: how a fixture value becomes the parser's argument.
+PARSERS = {
+    "place": upb.extract_place,
+    "publisher": upb.extract_publisher_name,
+    "date": lambda value: upb.extract_date(date_record(*value)),
+}
+
+
+# ---------------------------------------------------------------------------
+# Fixture
+# ---------------------------------------------------------------------------
+
+def date_record(f008, statement):
+    """A MarcRecord holding only what extract_date() reads."""
+    fields = {"008": [f008]}
+    if statement is not None:
+        fields["260"] = [{"subfields": {"c": [statement]}}]
+    return marc.MarcRecord(fields)
+
+
+def extract_fixture():
+    """{"place": [260 $a], "publisher": [260 $b], "date": [[008, 260 $c]]}
+    over every record in the ESTC download."""
+    fixture = {name: [] for name in PARSERS}
+    entries = estc_store.load()["entries"]
+    for key in sorted(entries):
+        for record in estc_store.lookup(key)["records"]:
+            if record.place is not None:
+                fixture["place"].append(record.place)
+            if record.publisher is not None:
+                fixture["publisher"].append(record.publisher)
+            statement = record.subfield("260", "c")
+            fixture["date"].append([record.control("008"), statement[0] if statement else None])
+    return fixture
+
+
+def run_parsers(fixture):
+    """Each parser's outputs over its fixture values, JSON-shaped."""
+    return {
+        name: [json.loads(json.dumps(parse(value))) for value in fixture[name]]
+        for name, parse in PARSERS.items()
+    }
+
+
+def write_json(data, path):
+    """{name: [value]} as JSON, one value per line, so that a changed output
+    shows in a diff as one changed line."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as fh:
+        fh.write("{\n")
+        for i, (name, values) in enumerate(data.items()):
+            fh.write(f" {json.dumps(name)}: [\n")
+            fh.write(",\n".join("  " + json.dumps(v, ensure_ascii=False) for v in values))
+            fh.write("\n ]" + ("," if i < len(data) - 1 else "") + "\n")
+        fh.write("}\n")
+
+
+def read_json(path):
+    with path.open(encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+# ---------------------------------------------------------------------------
+# Timing and checking
+# ---------------------------------------------------------------------------
+
+def time_parser(parse, values, rounds):
+    """Best wall time of `rounds` passes of `parse` over `values`."""
+    best = float("inf")
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        for value in values:
+            parse(value)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def check(fixture, snapshot):
+    """Print the values whose output differs from the snapshot; return how
+    many there are."""
+    differ = 0
+    current = run_parsers(fixture)
+    for name in PARSERS:
+        for value, expected, got in zip(fixture[name], snapshot[name], current[name]):
+            if got != expected:
+                differ += 1
+                if differ <= 20:
+                    print(f"  {name} {value!r}: snapshot {expected}, now {got}")
+    if differ > 20:
+        print(f"  ... and {differ - 20} more")
+    return differ
+
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--freeze", action="store_true",
+                    help="extract the fixture from the ESTC download and snapshot the outputs")
+    ap.add_argument("--snapshot", action="store_true",
+                    help="rewrite the snapshot from the current parsers")
+    ap.add_argument("--rounds", type=int, default=5,
+                    help="timing passes per parser, best taken (default: %(default)s)")
+    args = ap.parse_args()
+
+    if args.freeze:
+        write_json(extract_fixture(), FIXTURE_FILE)
+        print(f"Wrote {FIXTURE_FILE}")
+    try:
+        fixture = read_json(FIXTURE_FILE)
+    except FileNotFoundError:
+        sys.exit(f"No fixture at {FIXTURE_FILE}; build it with --freeze")
+    if args.freeze or args.snapshot:
+        write_json(run_parsers(fixture), SNAPSHOT_FILE)
+        print(f"Wrote {SNAPSHOT_FILE}")
+        return
+
+    snapshot = read_json(SNAPSHOT_FILE)
+    if any(len(snapshot[name]) != len(fixture[name]) for name in PARSERS):
+        sys.exit(f"{SNAPSHOT_FILE} does not match the fixture; rebuild it with --snapshot")
+
+    for name, parse in PARSERS.items():
+        values = fixture[name]
+        elapsed = time_parser(parse, values, args.rounds)
+        per = elapsed / len(values) * 1e6 if values else 0.0
+        print(f"{name:<10} {len(values):7d} values  {elapsed * 1e3:9.2f} ms  {per:7.2f} us/value")
+
+    differ = check(fixture, snapshot)
+    if differ:
+        print(f"{differ} outputs differ from the snapshot.")
+        sys.exit(1)
+    print("All outputs match the snapshot.")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,7 +14,8 @@ on the "Addit"/"Add" convention), it INVERTS the lookup:
   1. Parse every collections/*/*.xml in the clone once, building an index keyed
      on a normalized shelfmark -> {catalogue xml:id, facsimile URLs, file}.
      Each file already records its own msID and collection, so we never guess
-     filenames or maintain a subdir gazetteer.
+     filenames or maintain a subdir gazetteer. What each file contributes is
+     cached in ../.cache, so a rerun parses only files changed since the last.
   2. Normalize each DIMEV <idno> the same way and look it up.
   3. A second pass folds known abbreviation differences (addit->add etc.) so
      that mere convention variants MATCH instead of failing; those are reported
@@ -45,12 +46,17 @@ contains only the inserted elements.
 import argparse
 import csv
 import difflib
+import os
+import pickle
 import re
-from collections import defaultdict
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 from lxml import etree
 
+import corpus
+
 TEI = "http://www.tei-c.org/ns/1.0"
 XML = "http://www.w3.org/XML/1998/namespace"
 NS = {"t": TEI}
@@ -59,6 +65,11 @@ BODLEIAN_CLONE = Path("../../external-resources/oxford-medieval-mss/collections"
 DIMEV_MSS = Path("../../dimev/data/Manuscripts.xml")
 CATALOG_BASE = "https://medieval.bodleian.ox.ac.uk/catalog/"
 
+# Per-file extracts of the clone, keyed by path with the mtime and size they
+# were read at; see scan_clone(). Bump the version when extract_file() changes.
+INDEX_CACHE = corpus.CACHE_DIR / "bodleian-index.pickle"
+INDEX_CACHE_VERSION = 1
+
 REPORT_FILE = Path("../artefacts/bodleian-links-report.md")
 MATCHES_CSV = Path("../artefacts/bodleian-links-matches.csv")
 
@@ -132,38 +143,110 @@ def normalize(raw, fold=False):
     return " ".join(tokens)
 
 
-def build_index():
-    """Index the Bodleian clone: normalized shelfmark -> list of records."""
+def extract_file(path):
+    """What the index needs from one Bodleian file: (catalogue xml:id,
+    facsimile URLs, shelfmarks), or None if it is not a TEI document."""
+    try:
+        root = etree.parse(str(path)).getroot()
+    except etree.XMLSyntaxError:
+        return None
+    if not root.tag.endswith("}TEI"):
+        return None
+    cat_id = root.get(f"{{{XML}}}id")
+    facs = [
+        ref.get("target")
+        for ref in root.findall(
+            './/t:surrogates/t:bibl[@type="digital-facsimile"]//t:ref', NS
+        )
+        if ref.get("target")
+    ]
+    shelfmarks = []
+    for idno in root.findall('.//t:msIdentifier/t:idno[@type="shelfmark"]', NS):
+        shelf = (idno.text or "").strip()
+        if shelf:
+            shelfmarks.append(shelf)
+    return cat_id, facs, shelfmarks
+
+
+def load_index_cache():
+    try:
+        with INDEX_CACHE.open("rb") as fh:
+            cache = pickle.load(fh)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return {}
+    if cache.get("version") != INDEX_CACHE_VERSION:
+        return {}
+    return cache["files"]
+
+
+def save_index_cache(files):
+    corpus.CACHE_DIR.mkdir(exist_ok=True)
+    tmp = INDEX_CACHE.with_suffix(".tmp")
+    with tmp.open("wb") as fh:
+        pickle.dump({"version": INDEX_CACHE_VERSION, "files": files}, fh, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, INDEX_CACHE)
+
+
+def extract_files(paths, jobs=1):
+    """extract_file() over `paths`, in order. With jobs > 1 the files are
+    shared out in chunks to a pool of worker processes."""
+    if jobs <= 1 or len(paths) < 2:
+        return [extract_file(path) for path in paths]
+    chunksize = max(1, len(paths) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(extract_file, paths, chunksize=chunksize))
+
+
+def scan_clone(jobs=1):
+    """Per-file extracts for every collections/*/*.xml, in sorted path order.
+
+    Extracts are cached under ../.cache keyed by each file's path, mtime and
+    size; only files added or changed since the last run are parsed (by
+    `jobs` worker processes), and deleted files drop out of the cache."""
+    cached = load_index_cache()
+    files = {}
+    stale = []
+    for path in sorted(BODLEIAN_CLONE.glob("*/*.xml")):
+        rel = path.relative_to(BODLEIAN_CLONE.parent).as_posix()
+        st = path.stat()
+        hit = cached.get(rel)
+        if hit is not None and hit[0] == st.st_mtime_ns and hit[1] == st.st_size:
+            files[rel] = hit
+        else:
+            files[rel] = None  # placeholder, keeps the sorted order
+            stale.append((rel, path, st))
+    extracts = extract_files([path for _, path, _ in stale], jobs)
+    for (rel, _, st), extract in zip(stale, extracts):
+        files[rel] = (st.st_mtime_ns, st.st_size, extract)
+    if stale or files.keys() != cached.keys():
+        save_index_cache(files)
+    print(f"Bodleian clone: {len(files)} files, {len(stale)} parsed, "
+          f"{len(files) - len(stale)} from cache")
+    return files
+
+
+def build_index(jobs=1):
+    """Index the Bodleian clone: normalized shelfmark -> list of records.
+
+    The per-file extracts come from scan_clone(); the normalized keys are
+    computed afresh on every run, so a change to ABBREV or PHRASE takes effect
+    without invalidating the cache."""
     base = defaultdict(list)
     folded = defaultdict(list)
     n_files = n_shelfmarks = 0
-    for path in sorted(BODLEIAN_CLONE.glob("*/*.xml")):
-        try:
-            root = etree.parse(str(path)).getroot()
-        except etree.XMLSyntaxError:
-            continue
-        if not root.tag.endswith("}TEI"):
+    for rel, (_, _, extract) in scan_clone(jobs).items():
+        if extract is None:
             continue
         n_files += 1
-        cat_id = root.get(f"{{{XML}}}id")
-        facs = [
-            ref.get("target")
-            for ref in root.findall(
-                './/t:surrogates/t:bibl[@type="digital-facsimile"]//t:ref', NS
-            )
-            if ref.get("target")
-        ]
-        for idno in root.findall('.//t:msIdentifier/t:idno[@type="shelfmark"]', NS):
-            shelf = (idno.text or "").strip()
-            if not shelf:
-                continue
+        cat_id, facs, shelfmarks = extract
+        for shelf in shelfmarks:
             n_shelfmarks += 1
             rec = {
                 "shelfmark": shelf,
                 "cat_id": cat_id,
                 "cat_url": CATALOG_BASE + cat_id if cat_id else "",
                 "facsimiles": facs,
-                "file": path.relative_to(BODLEIAN_CLONE.parent).as_posix(),
+                "file": rel,
             }
             base[normalize(shelf)].append(rec)
             folded[normalize(shelf, fold=True)].append(rec)
@@ -178,7 +261,7 @@ def load_dimev_bodleian():
     type="printed" entry has no legitimate record to match and any apparent hit
     is a shelfmark-string collision (e.g. printed "Bodley 88" vs MS. Bodl. 88*).
     """
-    root = etree.parse(str(DIMEV_MSS)).getroot()
+    root = corpus.load(DIMEV_MSS, remove_blank_text=True).getroot()
     entries = []
     for msd in root.findall(".//t:msDesc", NS):
         repo = msd.findtext("t:msIdentifier/t:repository", default="", namespaces=NS)
@@ -201,7 +284,80 @@ def load_dimev_bodleian():
     return entries
 
 
-def classify(entries, base, folded, by_sig):
+def build_fuzzy_index(keys):
+    """Index normalized Bodleian keys for near_miss().
+
+    Keys are bucketed by identity signature, as the fuzzy pass requires, and
+    within a bucket grouped by collection-name signature, since the score
+    depends on nothing else. Each bucket has a character inverted index of
+    its collection names: name -> {char: [(name number, count)]}.
+
+    Returns {idsig: {"names": [collsig], "keys": [greatest key with that
+    collsig], "chars": {char: [(i, count)]}}}."""
+    grouped = defaultdict(dict)
+    for key in keys:
+        toks = key.split()
+        names = grouped[idsig(toks)]
+        name = collsig(toks)
+        if name not in names or key > names[name]:
+            names[name] = key
+    fuzzy = {}
+    for sig, names in grouped.items():
+        chars = defaultdict(list)
+        for i, name in enumerate(names):
+            for ch, n in Counter(name).items():
+                chars[ch].append((i, n))
+        fuzzy[sig] = {"names": list(names), "keys": list(names.values()), "chars": dict(chars)}
+    return fuzzy
+
+
+def near_miss(key, fuzzy, cutoff=FUZZY_CUTOFF):
+    """The Bodleian key that is the closest collection-name variant of `key`,
+    or None if none scores `cutoff` or better.
+
+    The score is difflib's ratio() between collection-name signatures, and the
+    answer is the one a scan of the whole bucket would give: the highest
+    score, ties going to the greatest key. The scan is cut short with an upper
+    bound: ratio() counts matched characters, so it can be no higher than the
+    share of characters two names have in common (difflib's quick_ratio),
+    and that is summed from the inverted index for every name in the bucket
+    at once. Names whose bound falls below the cutoff are never scored, and
+    the rest are scored best bound first until no bound can beat the best
+    score found. A name sharing no character with `key` has a bound of 0, so
+    the cutoff must be above 0."""
+    toks = key.split()
+    bucket = fuzzy.get(idsig(toks))
+    if bucket is None:
+        return None
+    target = collsig(toks)
+    names, keys = bucket["names"], bucket["keys"]
+    if not target:  # only another empty name can score
+        return keys[names.index("")] if "" in names else None
+    common = defaultdict(int)
+    for ch, n in Counter(target).items():
+        for i, m in bucket["chars"].get(ch, ()):
+            common[i] += min(n, m)
+    bounded = []
+    for i, shared in common.items():
+        bound = 2.0 * shared / (len(target) + len(names[i]))
+        if bound >= cutoff:
+            bounded.append((bound, keys[i], i))
+    bounded.sort(reverse=True)
+    matcher = difflib.SequenceMatcher(None, target)
+    best = None  # (score, key)
+    for bound, cand, i in bounded:
+        if best is not None and bound < best[0]:
+            break
+        matcher.set_seq2(names[i])
+        score = (matcher.ratio(), cand)
+        if best is None or score > best:
+            best = score
+    if best is None or best[0] < cutoff:
+        return None
+    return best[1]
+
+
+def classify(entries, base, folded, fuzzy):
     """Bucket entries against the Bodleian index: exact/abbrev/ambiguous/
     nearmiss/absent. Returns the five lists."""
     exact, abbrev, ambiguous, nearmiss, absent = [], [], [], [], []
@@ -218,16 +374,9 @@ def classify(entries, base, folded, by_sig):
             # Still no match. Among Bodleian keys sharing the exact enumeration,
             # is one a close collection-name variant (probable discrepancy)?
             # Otherwise treat as absent from medieval-mss.
-            toks = nf.split()
-            cands = by_sig.get(idsig(toks), [])
-            target = collsig(toks)
-            scored = sorted(
-                ((difflib.SequenceMatcher(None, target, collsig(c.split())).ratio(), c)
-                 for c in cands),
-                reverse=True,
-            )
-            if scored and scored[0][0] >= FUZZY_CUTOFF:
-                nearmiss.append((e, base[scored[0][1]]))
+            near = near_miss(nf, fuzzy)
+            if near is not None:
+                nearmiss.append((e, base[near]))
             else:
                 absent.append(e)
     return exact, abbrev, ambiguous, nearmiss, absent
@@ -245,8 +394,7 @@ def apply_links(matched):
     re-running (or running after manual pre-emption) is a no-op for already-linked
     entries. Returns (n_cat, n_surr, n_new_additional, skipped_cat, skipped_surr).
     """
-    parser = etree.XMLParser(remove_blank_text=True)
-    tree = etree.parse(str(DIMEV_MSS), parser)
+    tree = corpus.load(DIMEV_MSS, remove_blank_text=True)
     root = tree.getroot()
     by_id = {m.get(f"{{{XML}}}id"): m for m in root.findall(".//t:msDesc", NS)}
 
@@ -296,8 +444,7 @@ def apply_links(matched):
         ):
             additional.append(child)  # move into schema order
 
-    etree.indent(tree, space=4 * " ", level=0)
-    tree.write(str(DIMEV_MSS), pretty_print=True, xml_declaration=True, encoding="UTF-8")
+    corpus.write(tree, DIMEV_MSS)
     return n_cat, n_surr, n_new_add, skipped_cat, skipped_surr
 
 
@@ -308,24 +455,28 @@ def main():
         action="store_true",
         help="apply the matched links to Manuscripts.xml (default: dry run only)",
     )
+    ap.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="worker processes for parsing the clone (default: %(default)s)",
+    )
     args = ap.parse_args()
 
-    base, folded, n_files, n_shelf = build_index()
+    base, folded, n_files, n_shelf = build_index(args.jobs)
     all_entries = load_dimev_bodleian()
 
     # For the fuzzy pass: bucket Bodleian keys by identity signature so a
     # candidate must share the exact enumeration (numbers + single letters).
-    by_sig = defaultdict(list)
-    for k in base:
-        by_sig[idsig(k.split())].append(k)
+    fuzzy = build_fuzzy_index(base)
 
     # The Bodleian catalogue holds manuscripts only; link those. Printed-book
     # entries are tabulated separately as a footprint check, never linked.
     entries = [e for e in all_entries if e["type"] == "manuscript"]
     printed = [e for e in all_entries if e["type"] == "printed"]
 
-    exact, abbrev, ambiguous, nearmiss, absent = classify(entries, base, folded, by_sig)
-    p_exact, p_abbrev, p_ambig, p_near, p_absent = classify(printed, base, folded, by_sig)
+    exact, abbrev, ambiguous, nearmiss, absent = classify(entries, base, folded, fuzzy)
+    p_exact, p_abbrev, p_ambig, p_near, p_absent = classify(printed, base, folded, fuzzy)
 
     matched = exact + abbrev
     with_facs = sum(1 for e, h in matched if h[0]["facsimiles"])
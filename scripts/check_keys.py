@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+
+"""Resolve every key cited in Records.xml and report the dangling ones.
+
+Records.xml points outward by key: <bibl key="Wright1842b"> cites an edition,
+facsimile or repertory in the Zotero bibliography, and <source key="MS54">
+(<mss key> before the DIMEV 1.0 conversion) names a witness's manuscript,
+printed book or inscription. Nothing checked that those keys exist; bad ones
+were fixed only as they turned up, in update_records.BIBL_KEY_CROSSWALK.
+
+This script builds two indexes, each persisted through corpus.cached() and so
+rebuilt only when its source changes:
+
+    bibliography   citation key -> [resource URI]   one iterparse pass over
+                                                    Bibliography.rdf
+    sources        xml:id -> file name              one iterparse pass over
+                                                    each of Manuscripts.xml,
+                                                    PrintedBooks.xml and
+                                                    Inscriptions.xml
+
+then reads Records.xml in a single streaming pass and checks every key
+against them. A dangling key is reported with the records citing it and up to
+three close matches from its index, a key differing only in case first.
+
+The Zotero RDF export has no citation-key property of its own. A key is
+taken from a "Citation Key: ..." line in the item's Extra field (exported as
+dc:description, as Better BibTeX pins keys), or from z:citationKey where the
+export has one.
+
+Usage:
+    python3 check_keys.py              # report dangling keys
+    python3 check_keys.py --csv FILE   # also write them as CSV
+"""
+
+import argparse
+import csv
+import difflib
+import re
+from collections import defaultdict
+
+from lxml import etree
+
+import corpus
+
+SOURCE_FILES = (corpus.MANUSCRIPTS, corpus.PRINTED_BOOKS, corpus.INSCRIPTIONS)
+
+RDF = "{http://www.w3.org/1999/02/22-rdf-syntax-ns#}"
+DC_DESCRIPTION = "{http://purl.org/dc/elements/1.1/}description"
+Z_CITATION_KEY = "{http://www.zotero.org/namespaces/export#}citationKey"
+XML_ID = "{http://www.w3.org/XML/1998/namespace}id"
+
+KEY_LINE = re.compile(r"(?mi)^\s*Citation Key:\s*(\S+)\s*$")
+
+# Which index each cited element's key resolves against.
+KEY_TAGS = {"bibl": "bibliography", "mss": "sources", "source": "sources"}
+
+SUGGESTIONS = 3
+SUGGESTION_CUTOFF = 0.75
+
+
+# ---------------------------------------------------------------------------
+# Indexes
+# ---------------------------------------------------------------------------
+
+def citation_keys(resource):
+    """The citation keys of one resource element of the RDF, in order."""
+    found = [e.text.strip() for e in resource.iter(Z_CITATION_KEY) if e.text and e.text.strip()]
+    for desc in resource.iter(DC_DESCRIPTION):
+        found.extend(KEY_LINE.findall(desc.text or ""))
+    return list(dict.fromkeys(found))
+
+
+def build_bibliography_index(path):
+    """{citation key: [resource URI]} for the RDF at `path`, one resource
+    element in memory at a time. A key on two resources lists both."""
+    keys = defaultdict(list)
+    depth = 0
+    for event, elem in etree.iterparse(str(path), events=("start", "end")):
+        if event == "start":
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1:
+            continue
+        uri = elem.get(RDF + "about") or elem.get(RDF + "nodeID") or ""
+        for key in citation_keys(elem):
+            keys[key].append(uri)
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+    return dict(keys)
+
+
+def build_source_ids(path):
+    """The xml:ids of the top-level entries of a source file."""
+    ids = []
+    root = None
+    for event, elem in etree.iterparse(str(path), events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            continue
+        if elem.getparent() is root:
+            if elem.get(XML_ID):
+                ids.append(elem.get(XML_ID))
+            elem.clear()
+            while elem.getprevious() is not None:
+                del root[0]
+    return ids
+
+
+def load_indexes():
+    """{"bibliography": {key: [uri]}, "sources": {xml:id: file name}}, each
+    from the cache when its source is unchanged. A missing file contributes
+    nothing."""
+    bibliography = {}
+    if corpus.BIBLIOGRAPHY.exists():
+        bibliography = corpus.cached(corpus.BIBLIOGRAPHY, "citation-keys",
+                                     build_bibliography_index, parse=False)
+    sources = {}
+    for path in SOURCE_FILES:
+        if path.exists():
+            for xml_id in corpus.cached(path, "source-ids", build_source_ids, parse=False):
+                sources.setdefault(xml_id, path.name)
+    return {"bibliography": bibliography, "sources": sources}
+
+
+# ---------------------------------------------------------------------------
+# Checking
+# ---------------------------------------------------------------------------
+
+def cited_keys(path):
+    """{(tag, key): [record xml:id]} for every keyed <bibl>, <mss> and
+    <source> in Records.xml, read in one streaming pass."""
+    cited = defaultdict(list)
+    pending = []
+    for _, elem in etree.iterparse(str(path), events=("end",), tag=("record", *KEY_TAGS)):
+        if elem.tag != "record":
+            key = elem.get("key")
+            if key is not None:
+                pending.append((elem.tag, key))
+            continue
+        record_id = elem.get(XML_ID) or ""
+        for tag_key in dict.fromkeys(pending):
+            cited[tag_key].append(record_id)
+        pending.clear()
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+    return cited
+
+
+def suggest(key, candidates, folded):
+    """Up to SUGGESTIONS close matches for `key`: the keys equal to it but
+    for case, then difflib's closest."""
+    same_case = [c for c in folded.get(key.casefold(), []) if c != key]
+    close = difflib.get_close_matches(key, candidates, SUGGESTIONS, SUGGESTION_CUTOFF)
+    return list(dict.fromkeys(same_case + close))[:SUGGESTIONS]
+
+
+def check(cited, indexes):
+    """Rows for the dangling keys, most cited first:
+    {"tag", "key", "records", "suggestions"}."""
+    lookups = {}
+    for name, index in indexes.items():
+        folded = defaultdict(list)
+        for candidate in index:
+            folded[candidate.casefold()].append(candidate)
+        lookups[name] = (index, list(index), folded)
+
+    dangling = []
+    for (tag, key), records in cited.items():
+        index, candidates, folded = lookups[KEY_TAGS[tag]]
+        if key in index:
+            continue
+        dangling.append({
+            "tag": tag,
+            "key": key,
+            "records": records,
+            "suggestions": suggest(key, candidates, folded),
+        })
+    dangling.sort(key=lambda row: (-len(row["records"]), row["tag"], row["key"]))
+    return dangling
+
+
+def ambiguous_keys(bibliography):
+    return {key: uris for key, uris in bibliography.items() if len(uris) > 1}
+
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+
+def write_csv(dangling, path):
+    with open(path, "w", newline="", encoding="utf-8") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(["element", "key", "uses", "records", "suggestions"])
+        for row in dangling:
+            writer.writerow([row["tag"], row["key"], len(row["records"]),
+                             " ".join(row["records"]), " ".join(row["suggestions"])])
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--csv", metavar="FILE", help="also write the dangling keys here")
+    args = ap.parse_args()
+
+    indexes = load_indexes()
+    cited = cited_keys(corpus.RECORDS)
+    dangling = check(cited, indexes)
+
+    bibliography = indexes["bibliography"]
+    print(f"Bibliography: {len(bibliography)} citation keys; sources: {len(indexes['sources'])} ids")
+    for tag in KEY_TAGS:
+        keys = [k for t, k in cited if t == tag]
+        if keys:
+            missing = sum(1 for row in dangling if row["tag"] == tag)
+            print(f"  <{tag}>: {len(keys)} distinct keys, {missing} dangling")
+
+    for key, uris in sorted(ambiguous_keys(bibliography).items()):
+        print(f"Ambiguous citation key {key}: {', '.join(uris)}")
+
+    for row in dangling:
+        records = row["records"]
+        shown = ", ".join(records[:5]) + (f" and {len(records) - 5} more" if len(records) > 5 else "")
+        hint = f"  -- did you mean {', '.join(row['suggestions'])}?" if row["suggestions"] else ""
+        print(f"<{row['tag']} key=\"{row['key']}\"> in {shown}{hint}")
+
+    if args.csv:
+        write_csv(dangling, args.csv)
+        print(f"Wrote {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,46 +10,20 @@ the signal is in the NEAR bucket, where DIMEV closely tracks MARC but diverges.
 """
 
 from lxml import etree
-import os
 import re
-import json
 import difflib
 
+import corpus
+import estc_store
+import marc
+import similarity
+
 SOURCE_FILE = '../../dimev/data/PrintedBooks.xml'
-ESTC_DIR = '../../estc/estc_output/'
 REPORT_FILE = '../artefacts/title_comparison.txt'
 NAMESPACE = '{http://www.w3.org/XML/1998/namespace}'
 TEI = '{http://www.tei-c.org/ns/1.0}'
 
 
-def get_idno(monogr, type_):
-    for ref in monogr.findall(TEI + "idno"):
-        if ref.get("type") == type_:
-            return ref.text or ""
-    return ""
-
-
-def norm(s):
-    """Fold the incidental differences (case, ampersand/[and], brackets,
-    truncation marks, punctuation, whitespace) so the comparison ranks on
-    substantive divergence, not transcription conventions."""
-    s = s.lower()
-    s = s.replace("…", " ")
-    s = re.sub(r"\.\.\.", " ", s)
-    s = re.sub(r"\[and\]|\[et\]|&", " and ", s)
-    s = re.sub(r"[\[\]]", "", s)          # drop brackets, keep the content
-    s = re.sub(r"[^\w\s]", " ", s)        # drop punctuation
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
-
-
-def marc_245(rec):
-    sf = rec["245"][0]["subfields"]
-    a = " ".join(sf.get("a", []))
-    b = " ".join(sf.get("b", []))
-    return (a + " " + b).strip() if b else a.strip()
-
-
 def char_diff(a, b):
     """Compact inline diff of two normalized strings, marking DIMEV-only text
     with {-...-} and MARC-only text with {+...+}."""
@@ -68,20 +42,16 @@ def char_diff(a, b):
 
 
 def main():
-    files = set(os.listdir(ESTC_DIR))
-    root = etree.parse(SOURCE_FILE).getroot()
+    root = corpus.load(SOURCE_FILE).getroot()
 
     rows = []
     for item in root.findall(TEI + "biblStruct"):
         monogr = item.find(TEI + "monogr")
-        stc = get_idno(monogr, "STC")
+        stc = marc.get_idno(monogr, "STC")
         if not stc:
             continue
-        fn = "STC_" + re.sub(r"\.", "_", stc) + ".json"
-        if fn not in files:
-            continue
-        data = json.load(open(os.path.join(ESTC_DIR, fn)))
-        if data["matching_records"] != 1:
+        data = estc_store.lookup(stc)
+        if data is None or data["matching_records"] != 1:
             continue
         rec = data["records"][0]
         if "130" in rec or "240" in rec:        # has a uniform title; skip
@@ -91,12 +61,12 @@ def main():
 
         dimev_raw = (monogr.find(TEI + "title").text or "")
         dimev_raw = re.sub(r"\s+", " ", dimev_raw).strip()
-        marc_raw = marc_245(rec)
+        marc_raw = rec.title
 
-        d, m = norm(dimev_raw), norm(marc_raw)
+        d, m = marc.norm(dimev_raw), marc.norm(marc_raw)
         # compare over the overlapping prefix: either side may be truncated
         L = min(len(d), len(m))
-        ratio = difflib.SequenceMatcher(None, d[:L], m[:L]).ratio() if L else 0.0
+        ratio = similarity.ratio(d[:L], m[:L]) if L else 0.0
         rows.append({
             "stc": stc, "ratio": ratio, "len": L,
             "dimev": dimev_raw, "marc": marc_raw, "dn": d, "mn": m,
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+"""Shared loader for the DIMEV data files, with a fingerprint-keyed cache.
+
+Every script used to run its own ``etree.parse`` over Records.xml or
+Manuscripts.xml, so a chain of passes paid for the same parse many times over.
+This module gives them one entry point:
+
+    load(path)              parsed ElementTree, memoized in-process: a chained
+                            run parses each data file at most once
+    write(tree, path)       the usual indent + write pipeline; the memo is
+                            refreshed, so the next load() needs no re-parse
+    cached(path, name, fn)  fn(tree) persisted on disk, keyed by the source
+                            fingerprint: a rerun on unchanged data skips the
+                            parse entirely
+
+A source file is fingerprinted by (size, mtime, sha256). The content hash is
+what keys the caches; size and mtime only decide whether it must be recomputed,
+so an unchanged file is never read just to be hashed. Fingerprints and cached
+results live under ``../.cache`` (git-ignored); deleting that directory is
+always safe.
+
+lxml trees cannot be pickled, and re-reading a serialized tree costs as much as
+parsing the XML, so the on-disk cache holds what is derived from a tree
+(indexes, tallies, extracted rows), never the tree itself.
+
+The memo hands every caller the same tree object. A pass that mutates the tree
+without writing it leaves its changes visible to later loaders in the same
+process, which is what a chained run wants; call forget() to opt out.
+
+Usage:
+    python3 corpus.py                  # fingerprint the DIMEV data files
+    python3 corpus.py --clear          # empty the on-disk cache
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+from pathlib import Path
+
+from lxml import etree
+
+DATA_DIR = Path("../../dimev/data")
+RECORDS = DATA_DIR / "Records.xml"
+MANUSCRIPTS = DATA_DIR / "Manuscripts.xml"
+PRINTED_BOOKS = DATA_DIR / "PrintedBooks.xml"
+INSCRIPTIONS = DATA_DIR / "Inscriptions.xml"
+BIBLIOGRAPHY = DATA_DIR / "Bibliography.rdf"
+
+CACHE_DIR = Path("../.cache")
+STAMPS = CACHE_DIR / "fingerprints.json"
+
+# Bump when the pickled layout of cached() results changes incompatibly.
+CACHE_VERSION = 1
+
+_trees = {}     # (resolved path, remove_blank_text) -> (sha256, tree)
+_results = {}   # (resolved path, name) -> (sha256, result)
+_stamps = None
+
+
+def _load_stamps():
+    global _stamps
+    if _stamps is None:
+        try:
+            _stamps = json.loads(STAMPS.read_text())
+        except (OSError, ValueError):
+            _stamps = {}
+    return _stamps
+
+
+def _save_stamps():
+    CACHE_DIR.mkdir(exist_ok=True)
+    tmp = STAMPS.with_suffix(".tmp")
+    tmp.write_text(json.dumps(_stamps, indent=1, sort_keys=True))
+    os.replace(tmp, STAMPS)
+
+
+def sha256_file(path, bufsize=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(bufsize), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def fingerprint(path):
+    """(size, mtime_ns, sha256) of a file; the hash is reused while size and
+    mtime are unchanged."""
+    path = Path(path).resolve()
+    st = path.stat()
+    stamps = _load_stamps()
+    key = str(path)
+    old = stamps.get(key)
+    if old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+        return st.st_size, st.st_mtime_ns, old["sha256"]
+    digest = sha256_file(path)
+    stamps[key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
+    _save_stamps()
+    return st.st_size, st.st_mtime_ns, digest
+
+
+def load(path, remove_blank_text=False):
+    """Parse `path` once per process (per parser setting) and return the tree."""
+    key = (str(Path(path).resolve()), remove_blank_text)
+    digest = fingerprint(path)[2]
+    hit = _trees.get(key)
+    if hit and hit[0] == digest:
+        return hit[1]
+    parser = etree.XMLParser(remove_blank_text=remove_blank_text)
+    tree = etree.parse(str(path), parser)
+    _trees[key] = (digest, tree)
+    return tree
+
+
+def forget(path=None):
+    """Drop memoized trees (for `path`, or all), forcing a re-parse."""
+    if path is None:
+        _trees.clear()
+        return
+    resolved = str(Path(path).resolve())
+    for key in [k for k in _trees if k[0] == resolved]:
+        del _trees[key]
+
+
+def write(tree, path):
+    """Indent and write `tree` as the data files are written everywhere, then
+    re-key the memo to the new content so later loads reuse the tree."""
+    etree.indent(tree, space="    ", level=0)
+    tree.write(str(path), pretty_print=True, xml_declaration=True, encoding="UTF-8")
+    digest = fingerprint(path)[2]
+    resolved = str(Path(path).resolve())
+    for key, (_, memo_tree) in list(_trees.items()):
+        if key[0] == resolved:
+            if memo_tree is tree:
+                _trees[key] = (digest, tree)
+            else:
+                del _trees[key]
+
+
+def _cache_file(path, name, digest):
+    return CACHE_DIR / f"{Path(path).name}.{name}.{digest[:16]}.pickle"
+
+
+def cached(path, name, build, parse=True):
+    """Return build(tree) (or build(path) with parse=False), computed at most
+    once per content version of `path` and persisted under CACHE_DIR."""
+    resolved = str(Path(path).resolve())
+    digest = fingerprint(path)[2]
+    hit = _results.get((resolved, name))
+    if hit and hit[0] == digest:
+        return hit[1]
+
+    target = _cache_file(path, name, digest)
+    try:
+        with open(target, "rb") as fh:
+            version, stored_digest, result = pickle.load(fh)
+        if version != CACHE_VERSION or stored_digest != digest:
+            raise ValueError("stale cache entry")
+    except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+        result = build(load(path) if parse else path)
+        CACHE_DIR.mkdir(exist_ok=True)
+        for old in CACHE_DIR.glob(f"{Path(path).name}.{name}.*.pickle"):
+            old.unlink()
+        tmp = target.with_suffix(".tmp")
+        with open(tmp, "wb") as fh:
+            pickle.dump((CACHE_VERSION, digest, result), fh, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, target)
+
+    _results[(resolved, name)] = (digest, result)
+    return result
+
+
+def clear():
+    """Remove every cached result and fingerprint."""
+    global _stamps
+    if CACHE_DIR.exists():
+        for f in CACHE_DIR.iterdir():
+            if f.is_file():
+                f.unlink()
+    _stamps = None
+    _trees.clear()
+    _results.clear()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--clear", action="store_true", help="empty the on-disk cache")
+    args = ap.parse_args()
+
+    if args.clear:
+        clear()
+        print(f"Cleared {CACHE_DIR}")
+        return
+    for path in (RECORDS, MANUSCRIPTS, PRINTED_BOOKS, INSCRIPTIONS, BIBLIOGRAPHY):
+        if path.exists():
+            size, _, digest = fingerprint(path)
+            print(f"{path.name:18} {size:>12,} bytes  sha256 {digest[:16]}")
+        else:
+            print(f"{path.name:18} (missing)")
+
+
+if __name__ == "__main__":
+    main()
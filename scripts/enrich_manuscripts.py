@@ -65,6 +65,8 @@ import os
 import re
 from collections import Counter, OrderedDict
 
+import corpus
+
 # ---------------------------------------------------------------------------
 # CONFIGURATION
 # ---------------------------------------------------------------------------
@@ -412,8 +414,7 @@ def main():
     by_id = load_csv()
     log.info("Loaded %d CSV rows", len(by_id))
 
-    parser_obj = etree.XMLParser(remove_blank_text=True)
-    tree = etree.parse(SOURCE_FILE, parser_obj)
+    tree = corpus.load(SOURCE_FILE, remove_blank_text=True)
     root = tree.getroot()
 
     tally = Counter()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+"""The ESTC download packed into one indexed store, keyed by STC number.
+
+The printed-book scripts (update_printed_books, compare_titles,
+title_continuation) each used to list ../../estc/estc_output/, build an
+STC_<n>.json filename from every biblStruct's STC number and json.load that
+file, so a run over PrintedBooks.xml opened and parsed thousands of small
+files. This module packs the whole download once into ../.cache/estc.pickle:
+
+    STC number -> {"matching_records": n, "records": [MARC record, ...]}
+
+which a run then reads in one go. The MARC records are stored as downloaded
+(tag -> list of control values or {"subfields": {code: [values]}} fields);
+lookup() hands them out as marc.MarcRecord, each built once per run.
+
+A download file is named for its STC number with "." written as "_"
+(STC 9983.3 -> STC_9983_3.json); lookup() applies the same mapping, so a
+number resolves exactly as it did against the directory listing.
+
+The store records the modification time of the download directory, which
+changes whenever a file is added or removed, and is repacked automatically
+when that no longer matches. A file re-downloaded in place leaves the
+directory untouched: repack with --rebuild.
+
+Usage:
+    python3 estc_store.py              # pack the download if stale, print counts
+    python3 estc_store.py --rebuild    # repack unconditionally
+    python3 estc_store.py 5082 9983.3  # print the stored entries as JSON
+"""
+
+import argparse
+import json
+import os
+import pickle
+import sys
+from pathlib import Path
+
+import corpus
+import marc
+
+ESTC_DIR = Path("../../estc/estc_output")
+STORE_FILE = corpus.CACHE_DIR / "estc.pickle"
+
+# Bump when the layout of the pickled store changes.
+STORE_VERSION = 1
+
+_store = None
+_records = {}  # store key -> [MarcRecord], built on first lookup
+
+
+# ---------------------------------------------------------------------------
+# Packing
+# ---------------------------------------------------------------------------
+
+def stc_key(stc):
+    """The store key for an STC number: its download filename stem, less the
+    "STC_" prefix."""
+    return stc.replace(".", "_")
+
+
+def pack(estc_dir=ESTC_DIR):
+    """Read every STC_*.json in `estc_dir` and write the store. Returns it."""
+    entries = {}
+    for path in sorted(estc_dir.glob("STC_*.json")):
+        with path.open(encoding="utf-8") as fh:
+            data = json.load(fh)
+        entries[path.stem[len("STC_"):]] = {
+            "matching_records": data["matching_records"],
+            "records": data["records"],
+        }
+    store = {
+        "version": STORE_VERSION,
+        "source": str(estc_dir.resolve()),
+        "mtime_ns": estc_dir.stat().st_mtime_ns,
+        "entries": entries,
+    }
+    corpus.CACHE_DIR.mkdir(exist_ok=True)
+    tmp = STORE_FILE.with_suffix(".tmp")
+    with tmp.open("wb") as fh:
+        pickle.dump(store, fh, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, STORE_FILE)
+    return store
+
+
+def is_current(store, estc_dir=ESTC_DIR):
+    return (store.get("version") == STORE_VERSION
+            and store.get("source") == str(estc_dir.resolve())
+            and store.get("mtime_ns") == estc_dir.stat().st_mtime_ns)
+
+
+# ---------------------------------------------------------------------------
+# Lookup
+# ---------------------------------------------------------------------------
+
+def load(estc_dir=ESTC_DIR, rebuild=False):
+    """The store, memoized in-process; packed first if missing or stale."""
+    global _store
+    if _store is not None and not rebuild and is_current(_store, estc_dir):
+        return _store
+    store = None
+    if not rebuild:
+        try:
+            with STORE_FILE.open("rb") as fh:
+                store = pickle.load(fh)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            store = None
+        if store is not None and not is_current(store, estc_dir):
+            store = None
+    if store is None:
+        print(f"Packing the ESTC download in {estc_dir} ...")
+        store = pack(estc_dir)
+    _store = store
+    _records.clear()
+    return store
+
+
+def lookup(stc):
+    """{"matching_records", "records": [MarcRecord]} for an STC number, or
+    None if the download has no file for it."""
+    key = stc_key(stc)
+    entry = load()["entries"].get(key)
+    if entry is None:
+        return None
+    records = _records.get(key)
+    if records is None:
+        records = _records[key] = [marc.MarcRecord(rec) for rec in entry["records"]]
+    return {"matching_records": entry["matching_records"], "records": records}
+
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("stc", nargs="*", help="STC numbers to print")
+    ap.add_argument("--rebuild", action="store_true", help="repack the download unconditionally")
+    args = ap.parse_args()
+
+    store = load(rebuild=args.rebuild)
+    if not args.stc:
+        entries = store["entries"]
+        single = sum(1 for e in entries.values() if e["matching_records"] == 1)
+        print(f"{STORE_FILE}: {len(entries)} STC numbers, {single} with a single matching record")
+        return
+
+    missing = []
+    for stc in args.stc:
+        entry = store["entries"].get(stc_key(stc))
+        if entry is None:
+            missing.append(stc)
+        else:
+            print(json.dumps({stc: entry}, ensure_ascii=False, indent=1))
+    if missing:
+        print(f"Not in the ESTC download: {', '.join(missing)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
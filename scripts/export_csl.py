@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+
+"""Export the bibliography and the printed books as CSL-JSON.
+
+The site and downstream citation tools read CSL-JSON, the input format of
+citeproc and its kin, which nothing here produced. This script converts
+
+    Bibliography.rdf     every Zotero item (attachments and notes aside)
+    PrintedBooks.xml     every <biblStruct>, as a book
+
+into CSL-JSON items and writes them, in source order, to sharded files:
+
+    ../artefacts/csl/bibliography-0001.json ...   SHARD_SIZE items each, every
+    ../artefacts/csl/printed-0001.json ...        shard a CSL-JSON array
+    ../artefacts/csl/index.json                   {"shards": [{"file", "source",
+                                                  "items"}]}, in order
+
+Both sources are read with iterparse, one entry in memory at a time, and
+items are streamed into the current shard. Each finished shard is validated
+against ../schemas/csl-data.json by a pool of worker processes, each with
+the validator compiled once, while the export goes on. Invalid items are
+listed and the exit status is 1. Shards of an earlier export that this one
+does not rewrite are removed.
+
+A Zotero item's id is its citation key (see check_keys.citation_keys) or,
+failing one, its rdf:about less the "#"; a printed book's is its xml:id.
+The two share one id space, so an id used twice, within a source or across
+them, is reported with the invalid items. The Extra field (dc:description)
+gives "Number:" lines as collection-number, whether or not
+update_bibl_as_rdf.py has moved them to the series yet, matched by its own
+NUMBER_LINE; the rest of it becomes the note. Containers (series, journals, edited books) are
+read where Zotero nests them; one only referenced by URI is not followed.
+
+Usage:
+    python3 export_csl.py                  # export and validate
+    python3 export_csl.py --jobs 4         # validate in 4 processes
+    python3 export_csl.py --no-validate
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import jsonschema
+from lxml import etree
+
+import check_keys
+import corpus
+from update_bibl_as_rdf import NUMBER_LINE
+
+OUT_DIR = Path("../artefacts/csl")
+SCHEMA_FILE = Path("../schemas/csl-data.json")
+SHARD_SIZE = 500
+
+TEI = "{http://www.tei-c.org/ns/1.0}"
+XML_ID = "{http://www.w3.org/XML/1998/namespace}id"
+RDF = "{http://www.w3.org/1999/02/22-rdf-syntax-ns#}"
+DC = "{http://purl.org/dc/elements/1.1/}"
+DCTERMS = "{http://purl.org/dc/terms/}"
+BIB = "{http://purl.org/net/biblio#}"
+FOAF = "{http://xmlns.com/foaf/0.1/}"
+PRISM = "{http://prismstandard.org/namespaces/1.2/basic/}"
+VCARD = "{http://nwalsh.com/rdf/vCard#}"
+Z = "{http://www.zotero.org/namespaces/export#}"
+
+# Zotero item type -> CSL type; anything else is a "document".
+ITEM_TYPES = {
+    "book": "book",
+    "bookSection": "chapter",
+    "journalArticle": "article-journal",
+    "magazineArticle": "article-magazine",
+    "newspaperArticle": "article-newspaper",
+    "encyclopediaArticle": "entry-encyclopedia",
+    "dictionaryEntry": "entry-dictionary",
+    "conferencePaper": "paper-conference",
+    "thesis": "thesis",
+    "manuscript": "manuscript",
+    "report": "report",
+    "webpage": "webpage",
+    "letter": "personal_communication",
+    "map": "map",
+    "artwork": "graphic",
+}
+SKIPPED_TYPES = {"attachment", "note"}
+
+# Zotero creator lists -> CSL name variables.
+CREATOR_ROLES = {
+    BIB + "authors": "author",
+    BIB + "editors": "editor",
+    Z + "seriesEditors": "collection-editor",
+    Z + "translators": "translator",
+    BIB + "contributors": "contributor",
+}
+
+# Single-valued Zotero properties -> CSL variables.
+FIELDS = {
+    DC + "title": "title",
+    Z + "shortTitle": "title-short",
+    DC + "date": "issued",
+    PRISM + "volume": "volume",
+    PRISM + "number": "issue",
+    PRISM + "edition": "edition",
+    BIB + "pages": "page",
+    Z + "numberOfVolumes": "number-of-volumes",
+    Z + "numPages": "number-of-pages",
+    Z + "language": "language",
+    DC + "language": "language",
+    DCTERMS + "abstract": "abstract",
+}
+
+_validator = None
+
+
+# ---------------------------------------------------------------------------
+# Bibliography.rdf
+# ---------------------------------------------------------------------------
+
+def text_of(elem):
+    """Text content with whitespace collapsed; None for a missing element
+    or an empty one."""
+    if elem is None:
+        return None
+    return " ".join("".join(elem.itertext()).split()) or None
+
+
+def rdf_names(creators):
+    """CSL names from a Zotero creator list (an rdf:Seq of foaf:Person)."""
+    names = []
+    for person in creators.iter(FOAF + "Person"):
+        family = text_of(person.find(FOAF + "surname"))
+        given = text_of(person.find(FOAF + "givenName"))
+        if family and given:
+            names.append({"family": family, "given": given})
+        elif family or given:
+            names.append({"literal": family or given})
+    return names
+
+
+def rdf_fields(node, item):
+    """Copy the single-valued fields, identifiers, creators and publisher of
+    one Zotero node into `item`, leaving any variable already set."""
+    for child in node:
+        field = FIELDS.get(child.tag)
+        value = text_of(child)
+        if field and value and field not in item:
+            item[field] = {"raw": value} if field == "issued" else value
+        role = CREATOR_ROLES.get(child.tag)
+        if role and role not in item:
+            names = rdf_names(child)
+            if names:
+                item[role] = names
+    for ident in node.findall(DC + "identifier"):
+        uri = text_of(ident.find(f"{DCTERMS}URI/{RDF}value"))
+        value = text_of(ident)
+        if uri:
+            item.setdefault("URL", uri)
+        elif value:
+            kind, _, number = value.partition(" ")
+            if kind in ("ISBN", "ISSN", "DOI") and number:
+                item.setdefault(kind, number)
+    publisher = node.find(f"{DC}publisher/{FOAF}Organization")
+    if publisher is not None:
+        name = text_of(publisher.find(FOAF + "name"))
+        place = text_of(publisher.find(f"{VCARD}adr/{VCARD}Address/{VCARD}locality"))
+        if name:
+            item.setdefault("publisher", name)
+        if place:
+            item.setdefault("publisher-place", place)
+
+
+def rdf_container(part, item):
+    """Fill the container variables from a nested dcterms:isPartOf node."""
+    if len(part) == 0:
+        return  # a reference to a node elsewhere in the file: not followed
+    node = part if part.get(RDF + "parseType") == "Resource" else part[0]
+    title = text_of(node.find(DC + "title"))
+    if node.tag == BIB + "Series":
+        if title:
+            item.setdefault("collection-title", title)
+        number = text_of(node.find(DC + "identifier"))
+        if number:
+            item.setdefault("collection-number", number)
+        return
+    if title:
+        item.setdefault("container-title", title)
+    container = {}
+    rdf_fields(node, container)
+    container.pop("title", None)
+    container.pop("title-short", None)
+    for field, value in container.items():
+        item.setdefault(field, value)
+
+
+def rdf_item(resource, seen_ids):
+    """The CSL item for one top-level element of the RDF, or None if it is
+    not a Zotero item."""
+    item_type = text_of(resource.find(Z + "itemType"))
+    if item_type is None or item_type in SKIPPED_TYPES:
+        return None
+    about = resource.get(RDF + "about") or resource.get(RDF + "nodeID") or ""
+    keys = check_keys.citation_keys(resource)
+    item_id = keys[0] if keys and keys[0] not in seen_ids else about.lstrip("#")
+    seen_ids.add(item_id)
+
+    item = {"id": item_id, "type": ITEM_TYPES.get(item_type, "document")}
+    if keys:
+        item["citation-key"] = keys[0]
+    rdf_fields(resource, item)
+    for part in resource.findall(DCTERMS + "isPartOf"):
+        rdf_container(part, item)
+
+    notes = []
+    for desc in resource.findall(DC + "description"):
+        text = desc.text or ""
+        numbers = []
+        kept = []
+        for line in text.splitlines():
+            m = NUMBER_LINE.match(line)
+            if m:
+                numbers.append(m.group(1))
+            elif not check_keys.KEY_LINE.match(line):
+                kept.append(line)
+        if numbers:
+            item.setdefault("collection-number", ", ".join(numbers))
+        note = "\n".join(kept).strip()
+        if note:
+            notes.append(note)
+    if notes:
+        item["note"] = "\n\n".join(notes)
+    return item
+
+
+def bibliography_items(path):
+    """CSL items for the Zotero items in the RDF at `path`, in file order."""
+    seen_ids = set()
+    depth = 0
+    for event, elem in etree.iterparse(str(path), events=("start", "end")):
+        if event == "start":
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1:
+            continue
+        item = rdf_item(elem, seen_ids)
+        if item is not None:
+            yield item
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+
+# ---------------------------------------------------------------------------
+# PrintedBooks.xml
+# ---------------------------------------------------------------------------
+
+def date_parts(value):
+    """[year, month, day] from a W3C date ("1482", "1482-07-02"), or None."""
+    m = re.fullmatch(r"(\d{3,4})(?:-(\d\d))?(?:-(\d\d))?", value or "")
+    if not m:
+        return None
+    return [int(part) for part in m.groups() if part]
+
+
+def tei_issued(date):
+    """The CSL date of a TEI <date>: from @when, or @notBefore and @notAfter
+    as a range, else its text as a literal."""
+    when = date_parts(date.get("when"))
+    if when:
+        return {"date-parts": [when]}
+    start, end = date_parts(date.get("notBefore")), date_parts(date.get("notAfter"))
+    if start and end:
+        return {"date-parts": [start, end]}
+    text = text_of(date)
+    return {"literal": text} if text else None
+
+
+def printed_item(bs):
+    """The CSL item for one <biblStruct> of PrintedBooks.xml."""
+    monogr = bs.find(TEI + "monogr")
+    item = {"id": bs.get(XML_ID), "type": "book"}
+    if monogr is None:
+        return item
+    title = text_of(monogr.find(TEI + "title"))
+    if title:
+        item["title"] = title
+    authors = [text_of(a) for a in monogr.findall(TEI + "author")]
+    if any(authors):
+        item["author"] = [{"literal": a} for a in authors if a]
+    imprint = monogr.find(TEI + "imprint")
+    if imprint is not None:
+        place = text_of(imprint.find(TEI + "pubPlace"))
+        publisher = text_of(imprint.find(TEI + "publisher"))
+        if place:
+            item["publisher-place"] = place
+        if publisher:
+            item["publisher"] = publisher
+        date = imprint.find(TEI + "date")
+        issued = tei_issued(date) if date is not None else None
+        if issued:
+            item["issued"] = issued
+    idnos = {i.get("type"): text_of(i) for i in monogr.findall(TEI + "idno")}
+    custom = {t: idnos[t] for t in ("STC", "ESTC") if idnos.get(t)}
+    if custom:
+        item["custom"] = custom
+    return item
+
+
+def printed_items(path):
+    """CSL items for the biblStructs of PrintedBooks.xml, in file order."""
+    for _, bs in etree.iterparse(str(path), events=("end",), tag=TEI + "biblStruct"):
+        yield printed_item(bs)
+        bs.clear()
+        while bs.getprevious() is not None:
+            del bs.getparent()[0]
+
+
+SOURCES = {
+    "bibliography": (corpus.BIBLIOGRAPHY, bibliography_items),
+    "printed": (corpus.PRINTED_BOOKS, printed_items),
+}
+
+
+# ---------------------------------------------------------------------------
+# Validation (in the worker processes)
+# ---------------------------------------------------------------------------
+
+def load_schema(schema_file=SCHEMA_FILE):
+    with open(schema_file, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def init_validator(schema):
+    """Compile the item schema of csl-data.json once for this process."""
+    global _validator
+    cls = jsonschema.validators.validator_for(schema)
+    cls.check_schema(schema)
+    item_schema = dict(schema["items"], definitions=schema["definitions"])
+    _validator = cls(item_schema)
+
+
+def validate_shard(path):
+    """[(item id, error)] for the items of one shard file."""
+    with open(path, encoding="utf-8") as fh:
+        items = json.load(fh)
+    errors = []
+    for item in items:
+        for err in _validator.iter_errors(item):
+            where = "/".join(str(p) for p in err.absolute_path) or "(item)"
+            errors.append((item.get("id"), f"{where}: {err.message}"))
+    return errors
+
+
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+
+def write_shard(items, path):
+    """A CSL-JSON array, one item per line."""
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("w", encoding="utf-8") as fh:
+        fh.write("[\n")
+        fh.write(",\n".join(json.dumps(item, ensure_ascii=False) for item in items))
+        fh.write("\n]\n")
+    os.replace(tmp, path)
+
+
+def shards(items, size):
+    """Lists of up to `size` consecutive items."""
+    shard = []
+    for item in items:
+        shard.append(item)
+        if len(shard) == size:
+            yield shard
+            shard = []
+    if shard:
+        yield shard
+
+
+def export(out_dir=OUT_DIR, shard_size=SHARD_SIZE, jobs=1, validate=True):
+    """Write every source's shards and the index, validating each shard as
+    it is written and checking that no id is used twice. Returns (index,
+    [(shard, item id, error)])."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    pool = None
+    if validate:
+        schema = load_schema()
+        if jobs > 1:
+            pool = ProcessPoolExecutor(max_workers=jobs, initializer=init_validator, initargs=(schema,))
+        else:
+            init_validator(schema)
+
+    index = {"shards": []}
+    checks = []  # (shard file name, future or errors)
+    written = set()
+    first_use = {}  # item id -> shard file name
+    errors = []
+    try:
+        for source, (path, read_items) in SOURCES.items():
+            if not path.exists():
+                print(f"{path}: not found, skipped")
+                continue
+            count = 0
+            for n, shard in enumerate(shards(read_items(path), shard_size), start=1):
+                name = f"{source}-{n:04d}.json"
+                write_shard(shard, out_dir / name)
+                for item in shard:
+                    if item["id"] in first_use:
+                        errors.append((name, item["id"], f"id already used in {first_use[item['id']]}"))
+                    else:
+                        first_use[item["id"]] = name
+                written.add(name)
+                index["shards"].append({"file": name, "source": source, "items": len(shard)})
+                count += len(shard)
+                if pool is not None:
+                    checks.append((name, pool.submit(validate_shard, out_dir / name)))
+                elif validate:
+                    checks.append((name, validate_shard(out_dir / name)))
+            print(f"{path.name}: {count} items")
+        for name, result in checks:
+            shard_errors = result if isinstance(result, list) else result.result()
+            errors.extend((name, item_id, message) for item_id, message in shard_errors)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    for stale in out_dir.glob("*-[0-9][0-9][0-9][0-9].json"):
+        if stale.name not in written:
+            stale.unlink()
+    write_shard_index(index, out_dir / "index.json")
+    return index, errors
+
+
+def write_shard_index(index, path):
+    with path.open("w", encoding="utf-8") as fh:
+        json.dump(index, fh, indent=1)
+        fh.write("\n")
+
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--out", type=Path, default=OUT_DIR,
+                    help="directory for the shards (default: %(default)s)")
+    ap.add_argument("--shard-size", type=int, default=SHARD_SIZE,
+                    help="items per shard file (default: %(default)s)")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                    help="validating processes (default: %(default)s)")
+    ap.add_argument("--no-validate", action="store_true",
+                    help="write the shards without checking them against the schema")
+    args = ap.parse_args()
+
+    index, errors = export(args.out, max(1, args.shard_size), max(1, args.jobs), not args.no_validate)
+    print(f"Wrote {len(index['shards'])} shards to {args.out}")
+    for name, item_id, message in errors[:50]:
+        print(f"  {name} {item_id}: {message}")
+    if len(errors) > 50:
+        print(f"  ... and {len(errors) - 50} more")
+    if errors:
+        print(f"{len(errors)} errors.")
+        sys.exit(1)
+    if not args.no_validate:
+        print(f"All items valid against {SCHEMA_FILE}.")
+
+
+if __name__ == "__main__":
+    main()
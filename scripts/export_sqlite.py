@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+
+"""Mirror the DIMEV data files into a normalized SQLite database.
+
+Reports keep re-deriving the same joins from the XML: records to witnesses to
+manuscripts and printed books, plus subject and form terms and repertory
+numbers. This script exports them once into tables that SQL can join on indexed
+keys:
+
+    records       id, position, alpha, name, sha256
+    titles        record_id, position, title
+    persons       record_id, witness_id, role (author/scribe), first, last, suffix
+    terms         record_id, kind (subject/verseForm), term
+    repertories   record_id, key, number
+    witnesses     id, record_id, position, source_key, illust, music
+    bibls         record_id, witness_id, context (parent block), key, text
+    pointers      record_id, target (internal cross-references, without "#")
+    sources       id, file (Manuscripts/Inscriptions/PrintedBooks), type,
+                  country, settlement, repository, idno, name, sha256
+    printed       id, stc, estc, title, author, pub_place, publisher, date
+
+`witnesses.source_key` and `bibls.key` join to `sources.id`; `printed` adds the
+bibliographic fields for the `sources` rows of PrintedBooks.xml. Every join key
+is indexed. Records without an xml:id (cross-reference stubs) are not exported.
+
+The refresh is incremental. A data file whose content hash is unchanged since
+the last export is skipped. Otherwise each Records.xml record is hashed as raw
+bytes, using the byte ranges from record_index.py, and only new or changed
+records are parsed and re-inserted. Manuscripts, inscriptions and printed
+books are hashed per entry in the same way. Rows of entries that have gone
+from the source are deleted.
+
+Usage:
+    python3 export_sqlite.py                 # create or refresh ../artefacts/dimev.sqlite
+    python3 export_sqlite.py --rebuild       # drop the database and export everything
+    python3 export_sqlite.py --db out.sqlite
+"""
+
+import argparse
+import hashlib
+import mmap
+import sqlite3
+from pathlib import Path
+
+from lxml import etree
+
+import corpus
+import record_index
+
+TEI = "http://www.tei-c.org/ns/1.0"
+XML_ID = "{http://www.w3.org/XML/1998/namespace}id"
+NS = {"t": TEI}
+
+DB_FILE = Path("../artefacts/dimev.sqlite")
+
+# Bump when the table layout changes: an older database is rebuilt.
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE files (
+    name TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL
+);
+CREATE TABLE records (
+    id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    alpha TEXT,
+    name TEXT,
+    sha256 TEXT NOT NULL
+);
+CREATE TABLE titles (
+    record_id TEXT NOT NULL REFERENCES records(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    title TEXT
+);
+CREATE TABLE persons (
+    record_id TEXT NOT NULL REFERENCES records(id) ON DELETE CASCADE,
+    witness_id TEXT,
+    role TEXT NOT NULL,
+    first TEXT,
+    last TEXT,
+    suffix TEXT
+);
+CREATE TABLE terms (
+    record_id TEXT NOT NULL REFERENCES records(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    term TEXT NOT NULL
+);
+CREATE TABLE repertories (
+    record_id TEXT NOT NULL REFERENCES records(id) ON DELETE CASCADE,
+    key TEXT,
+    number TEXT
+);
+CREATE TABLE witnesses (
+    id TEXT PRIMARY KEY,
+    record_id TEXT NOT NULL REFERENCES records(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    source_key TEXT,
+    illust TEXT,
+    music TEXT
+);
+CREATE TABLE bibls (
+    record_id TEXT NOT NULL REFERENCES records(id) ON DELETE CASCADE,
+    witness_id TEXT,
+    context TEXT,
+    key TEXT,
+    text TEXT
+);
+CREATE TABLE pointers (
+    record_id TEXT NOT NULL REFERENCES records(id) ON DELETE CASCADE,
+    target TEXT NOT NULL
+);
+CREATE TABLE sources (
+    id TEXT PRIMARY KEY,
+    file TEXT NOT NULL,
+    type TEXT,
+    country TEXT,
+    settlement TEXT,
+    repository TEXT,
+    idno TEXT,
+    name TEXT,
+    sha256 TEXT NOT NULL
+);
+CREATE TABLE printed (
+    id TEXT PRIMARY KEY REFERENCES sources(id) ON DELETE CASCADE,
+    stc TEXT,
+    estc TEXT,
+    title TEXT,
+    author TEXT,
+    pub_place TEXT,
+    publisher TEXT,
+    date TEXT
+);
+CREATE INDEX titles_record ON titles(record_id);
+CREATE INDEX persons_record ON persons(record_id);
+CREATE INDEX persons_witness ON persons(witness_id);
+CREATE INDEX persons_last ON persons(last);
+CREATE INDEX terms_record ON terms(record_id);
+CREATE INDEX terms_term ON terms(kind, term);
+CREATE INDEX repertories_record ON repertories(record_id);
+CREATE INDEX repertories_number ON repertories(key, number);
+CREATE INDEX witnesses_record ON witnesses(record_id);
+CREATE INDEX witnesses_source ON witnesses(source_key);
+CREATE INDEX bibls_record ON bibls(record_id);
+CREATE INDEX bibls_witness ON bibls(witness_id);
+CREATE INDEX bibls_key ON bibls(key);
+CREATE INDEX pointers_record ON pointers(record_id);
+CREATE INDEX pointers_target ON pointers(target);
+CREATE INDEX sources_file ON sources(file);
+CREATE INDEX sources_idno ON sources(idno);
+CREATE INDEX printed_stc ON printed(stc);
+CREATE INDEX printed_estc ON printed(estc);
+"""
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+def text_of(elem):
+    """Text content with whitespace collapsed; None for a missing element."""
+    if elem is None:
+        return None
+    return " ".join("".join(elem.itertext()).split())
+
+
+def sha256_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def open_db(path, rebuild=False):
+    if rebuild and path.exists():
+        path.unlink()
+    con = sqlite3.connect(path)
+    con.execute("PRAGMA foreign_keys = ON")
+    if con.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+        con.close()
+        path.unlink()
+        con = sqlite3.connect(path)
+        con.execute("PRAGMA foreign_keys = ON")
+        con.executescript(SCHEMA)
+        con.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return con
+
+
+def file_unchanged(con, path):
+    digest = corpus.fingerprint(path)[2]
+    row = con.execute("SELECT sha256 FROM files WHERE name = ?", (path.name,)).fetchone()
+    return digest, row is not None and row[0] == digest
+
+
+def mark_file(con, path, digest):
+    con.execute(
+        "INSERT INTO files (name, sha256) VALUES (?, ?) "
+        "ON CONFLICT(name) DO UPDATE SET sha256 = excluded.sha256",
+        (path.name, digest),
+    )
+
+
+# ---------------------------------------------------------------------------
+# Records.xml
+# ---------------------------------------------------------------------------
+
+def insert_record(con, record, record_id, position, sha256):
+    con.execute(
+        "INSERT INTO records (id, position, alpha, name, sha256) VALUES (?, ?, ?, ?, ?)",
+        (record_id, position, text_of(record.find("alpha")), text_of(record.find("name")), sha256),
+    )
+    titles = record.find("titles")
+    if titles is not None:
+        con.executemany(
+            "INSERT INTO titles (record_id, position, title) VALUES (?, ?, ?)",
+            [(record_id, i, text_of(t)) for i, t in enumerate(titles.findall("title"))],
+        )
+    for kind in ("subject", "verseForm"):
+        con.executemany(
+            "INSERT INTO terms (record_id, kind, term) VALUES (?, ?, ?)",
+            [(record_id, kind, text_of(t)) for t in record.iter(kind) if text_of(t)],
+        )
+    repertories = record.find("repertories")
+    if repertories is not None:
+        con.executemany(
+            "INSERT INTO repertories (record_id, key, number) VALUES (?, ?, ?)",
+            [(record_id, b.get("key"), text_of(b)) for b in repertories.iter("bibl")],
+        )
+
+    witnesses = record.find("witnesses")
+    if witnesses is not None:
+        for i, wit in enumerate(witnesses.findall("witness")):
+            wit_id = wit.get(XML_ID)
+            source = wit.find("source")
+            if wit_id is not None:
+                con.execute(
+                    "INSERT OR REPLACE INTO witnesses (id, record_id, position, source_key, illust, music) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (wit_id, record_id, i, source.get("key") if source is not None else None,
+                     wit.get("illust"), wit.get("music")),
+                )
+
+    for elem in record.iter("author", "scribe"):
+        con.execute(
+            "INSERT INTO persons (record_id, witness_id, role, first, last, suffix) VALUES (?, ?, ?, ?, ?, ?)",
+            (record_id, witness_id(elem), elem.tag, text_of(elem.find("first")),
+             text_of(elem.find("last")), text_of(elem.find("suffix"))),
+        )
+    rows = []
+    for elem in record.iter("bibl", "mss"):
+        if elem.get("key") is None:
+            continue
+        parent = elem.getparent()
+        if parent.tag == "item":  # editions/item/bibl: report the list, not the wrapper
+            parent = parent.getparent()
+        rows.append((record_id, witness_id(elem), parent.tag, elem.get("key"), text_of(elem)))
+    con.executemany(
+        "INSERT INTO bibls (record_id, witness_id, context, key, text) VALUES (?, ?, ?, ?, ?)", rows
+    )
+    rows = []
+    for elem in record.iter("ptr", "ref"):
+        target = elem.get("target") or ""
+        if target.startswith("#"):
+            rows.append((record_id, target[1:]))
+    con.executemany("INSERT INTO pointers (record_id, target) VALUES (?, ?)", rows)
+
+
+def witness_id(elem):
+    """xml:id of the witness containing `elem`, or None at record level."""
+    for ancestor in elem.iterancestors("witness"):
+        return ancestor.get(XML_ID)
+    return None
+
+
+def export_records(con, path):
+    digest, unchanged = file_unchanged(con, path)
+    if unchanged:
+        print(f"{path.name}: unchanged")
+        return
+    known = dict(con.execute("SELECT id, sha256 FROM records"))
+    spans = record_index.load_index(path)["spans"]
+    seen = set()
+    changed = 0
+    with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        for position, (start, end, record_id) in enumerate(spans):
+            if record_id is None or record_id in seen:
+                continue
+            seen.add(record_id)
+            data = buf[start:end]
+            sha256 = sha256_bytes(data)
+            if known.get(record_id) == sha256:
+                con.execute("UPDATE records SET position = ? WHERE id = ?", (position, record_id))
+                continue
+            con.execute("DELETE FROM records WHERE id = ?", (record_id,))
+            insert_record(con, etree.fromstring(data), record_id, position, sha256)
+            changed += 1
+    gone = [(record_id,) for record_id in known if record_id not in seen]
+    con.executemany("DELETE FROM records WHERE id = ?", gone)
+    mark_file(con, path, digest)
+    print(f"{path.name}: {changed} records written, {len(gone)} deleted, "
+          f"{len(seen) - changed} unchanged")
+
+
+# ---------------------------------------------------------------------------
+# Manuscripts.xml, Inscriptions.xml, PrintedBooks.xml
+# ---------------------------------------------------------------------------
+
+def msdesc_row(msd):
+    msid = msd.find("t:msIdentifier", NS)
+    def field(tag):
+        return text_of(msid.find(f"t:{tag}", NS)) if msid is not None else None
+    return {
+        "type": msd.get("type"),
+        "country": field("country"),
+        "settlement": field("settlement"),
+        "repository": field("repository"),
+        "idno": field("idno"),
+        "name": field("msName"),
+    }
+
+
+def biblstruct_row(bs):
+    monogr = bs.find("t:monogr", NS)
+    def idno(type_):
+        return text_of(monogr.find(f"t:idno[@type='{type_}']", NS))
+    row = {"type": "printed", "country": None, "settlement": None, "repository": None,
+           "idno": idno("STC") or idno("ESTC"), "name": None}
+    printed = {
+        "stc": idno("STC"),
+        "estc": idno("ESTC"),
+        "title": text_of(monogr.find("t:title", NS)),
+        "author": "; ".join(text_of(a) for a in monogr.findall("t:author", NS)) or None,
+        "pub_place": text_of(monogr.find("t:imprint/t:pubPlace", NS)),
+        "publisher": text_of(monogr.find("t:imprint/t:publisher", NS)),
+        "date": text_of(monogr.find("t:imprint/t:date", NS)),
+    }
+    return row, printed
+
+
+def export_sources(con, path, label):
+    digest, unchanged = file_unchanged(con, path)
+    if unchanged:
+        print(f"{path.name}: unchanged")
+        return
+    root = corpus.load(path).getroot()
+    known = dict(con.execute("SELECT id, sha256 FROM sources WHERE file = ?", (label,)))
+    seen = set()
+    changed = 0
+    for elem in root.iter(f"{{{TEI}}}msDesc", f"{{{TEI}}}biblStruct"):
+        source_id = elem.get(XML_ID)
+        if source_id is None or source_id in seen:
+            continue
+        seen.add(source_id)
+        sha256 = sha256_bytes(etree.tostring(elem, method="c14n"))
+        if known.get(source_id) == sha256:
+            continue
+        if elem.tag == f"{{{TEI}}}biblStruct":
+            row, printed = biblstruct_row(elem)
+        else:
+            row, printed = msdesc_row(elem), None
+        con.execute("DELETE FROM sources WHERE id = ?", (source_id,))
+        con.execute(
+            "INSERT INTO sources (id, file, type, country, settlement, repository, idno, name, sha256) "
+            "VALUES (:id, :file, :type, :country, :settlement, :repository, :idno, :name, :sha256)",
+            dict(row, id=source_id, file=label, sha256=sha256),
+        )
+        if printed is not None:
+            con.execute(
+                "INSERT INTO printed (id, stc, estc, title, author, pub_place, publisher, date) "
+                "VALUES (:id, :stc, :estc, :title, :author, :pub_place, :publisher, :date)",
+                dict(printed, id=source_id),
+            )
+        changed += 1
+    gone = [(source_id,) for source_id in known if source_id not in seen]
+    con.executemany("DELETE FROM sources WHERE id = ?", gone)
+    mark_file(con, path, digest)
+    print(f"{path.name}: {changed} entries written, {len(gone)} deleted, "
+          f"{len(seen) - changed} unchanged")
+
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--db", type=Path, default=DB_FILE, help="database file (default: %(default)s)")
+    ap.add_argument("--rebuild", action="store_true", help="drop the database and export everything")
+    args = ap.parse_args()
+
+    con = open_db(args.db, rebuild=args.rebuild)
+    with con:
+        if corpus.RECORDS.exists():
+            export_records(con, corpus.RECORDS)
+        for path, label in ((corpus.MANUSCRIPTS, "Manuscripts"),
+                            (corpus.INSCRIPTIONS, "Inscriptions"),
+                            (corpus.PRINTED_BOOKS, "PrintedBooks")):
+            if path.exists():
+                export_sources(con, path, label)
+            else:
+                print(f"{path.name}: missing, skipped")
+    con.execute("ANALYZE")
+    con.close()
+    print(f"Wrote {args.db}")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,38 +10,107 @@
 
 # Results are written to the `artefacts/` directory.
 
+# Usage: python3 inspect_records.py [--print-summary | --no-print-summary]
+# Without either flag the script asks, if run at a terminal. Other scripts can
+# call analyse() for the statistics without rendering the report.
+
+import argparse
+import heapq
 import os
-import xmltodict
 import re
+import sys
+from collections import Counter
+from itertools import accumulate
+from lxml import etree
 
 source = '../../dimev/data/Records.xml'
 dest_dir = '../artefacts/'
 log_file = 'warnings.txt'
 summary_output = 'summary-analysis-of-Records.md'
+namespace = '{http://www.w3.org/XML/1998/namespace}'
+
+def iter_records(source):
+    # Yield each <record> as soon as it has been parsed, then free it, so only
+    # one record is held in memory at a time.
+    print(f'Streaming records from `{source}`...\n')
+    for event, record in etree.iterparse(source, events=('end',), tag='record'):
+        yield record
+        record.clear()
+        parent = record.getparent()
+        if parent is not None:
+            while record.getprevious() is not None:
+                del parent[0]
+
+def has_content(elem):
+    # An element with attributes or child elements (as opposed to an empty or
+    # text-only element) is what the walk treats as a structured node
+    if elem.attrib:
+        return True
+    for child in elem:
+        if isinstance(child.tag, str):
+            return True
+    return False
+
+def normalize_text(string):
+    if string is None:
+        return ''
+    string = re.sub(' {2,}', ' ', string) # remove whitespace
+    string = re.sub('\n', '', string) # remove newlines
+    return string
 
-def read_xml_to_string(source):
-    print(f'Reading source file `{source}` to string...')
-    with open(source) as f:
-        xml_string = f.read()
-    print('Preprocessing string...')
-    xml_string = re.sub(' {2,}', ' ', xml_string) # remove whitespace
-    xml_string = re.sub('\\n', '', xml_string) # remove newlines
-    xml_string = re.sub('<lb/>', '\\n    ', xml_string) # replace <lb/> elements with newlines and spaced indent
-    xml_string = re.sub('<sup>', 'BEGIN_SUP', xml_string) # replace <sup> tags
-    xml_string = re.sub('</sup>', 'END_SUP', xml_string)
-    xml_string = re.sub('<i>', 'BEGIN_ITALICS', xml_string)  # replace <i> tags
-    xml_string = re.sub('</i>', 'END_ITALICS', xml_string)
-    xml_string = re.sub(r'<ref xml:target="([\.0-9]+)" *>[0-9]+</ref>', 'DIMEV_' + r'\1', xml_string)
-    # xml_string = re.sub(r'<mss key="([A-Za-z0-9]+)"/>', 'MS_' + r'\1', xml_string) # This substitution disrupts rendering of <ghost>
-    return xml_string
-
-def xml_to_dict(xml_string):
-    print('Parsing string as a Python dictionary...\n')
-    xml_dict = xmltodict.parse(xml_string)
-    items = xml_dict['records']['record'] # strip outer keys
-    return items
-
-def warn(msg, dimevID):
+def render_title(title):
+    # Flatten a <title> to a string: <lb/> becomes a newline and spaced indent,
+    # <sup> is marked BEGIN_SUP/END_SUP, <i> BEGIN_ITALICS/END_ITALICS, and a
+    # numeric cross-reference <ref xml:target="n">n</ref> becomes DIMEV_n
+    parts = []
+    skip_text = False
+    for event, elem in etree.iterwalk(title, events=('start', 'end')):
+        if not isinstance(elem.tag, str): # comments and PIs: keep the tail only
+            if event == 'end':
+                parts.append(normalize_text(elem.tail))
+            continue
+        if event == 'start':
+            skip_text = False
+            if elem is not title:
+                if elem.tag == 'lb':
+                    parts.append('\n    ')
+                elif elem.tag == 'sup':
+                    parts.append('BEGIN_SUP')
+                elif elem.tag == 'i':
+                    parts.append('BEGIN_ITALICS')
+                elif elem.tag == 'ref' and is_numeric_ref(elem):
+                    parts.append('DIMEV_' + elem.get(namespace + 'target'))
+                    skip_text = True
+            if not skip_text:
+                parts.append(normalize_text(elem.text))
+        else:
+            if elem is title:
+                break
+            if elem.tag == 'sup':
+                parts.append('END_SUP')
+            elif elem.tag == 'i':
+                parts.append('END_ITALICS')
+            parts.append(normalize_text(elem.tail))
+    return ''.join(parts).strip()
+
+def is_numeric_ref(ref):
+    target = ref.get(namespace + 'target', '')
+    return (list(ref.attrib) == [namespace + 'target']
+            and re.fullmatch(r'[\.0-9]+', target) is not None
+            and re.fullmatch('[0-9]+', ref.text or '') is not None
+            and len(ref) == 0)
+
+def get_title(record):
+    # The first title of a record, or None if the record has no titles
+    titles = record.find('titles')
+    if titles is None:
+        return None
+    title = titles.find('title')
+    if title is None:
+        return None
+    return strip_italics(render_title(title))
+
+def warn(msg, warning_log):
     msg = 'WARNING: ' + msg
     warning_log.append(msg)
 
@@ -74,290 +143,335 @@ def strip_italics(string):
 
 def get_editions(dimevID, witness):
     editions = False
-    if 'editions' in witness:
+    if witness.find('editions') is not None:
         editions = True
     return editions
 
-# read the source file to string and pre-process
-xml_string = read_xml_to_string(source)
-
-# create a dictionary
-items = xml_to_dict(xml_string)
-
-# create empty counters and containers
-## data errors
-item_not_dict = 0
-missing_witnesses = 0
-witnesses_not_dict = 0
-witnesses_without_child = 0
-
-## valid item types
-no_id = 0
-child_is_dict = 0
-child_is_list = 0
-
-## collection containers
-warning_log = ['Warnings from the latest run of `inspect-Records.py`.']
-markdown = []
-document_contents = {} # a "Manuscript Index" to DIMEV, expressed as dict (for each key-value pair, the key is a source identifier, the value is a list of items in that source)
-item_records = [] # a selective record of DIMEV items
-
-## total hits (all witnesses of all valid items)
-checks = 0
-
-for idx in range(len(items)):
-    item = items[idx]
-    if type(item) != dict:
-        msg = 'Unexpected data type. <record> is not a dictionary'
-        warn(msg, '')
-        item_not_dict += 1
-    else:
-        if '@xml:id' not in item:
-            no_id += 1
+def get_source_key(witness):
+    return witness.find('source').get('key')
+
+def walk_records(source):
+    # create empty counters and containers
+    walk = {
+        ## data errors
+        'item_not_dict': 0,
+        'missing_witnesses': 0,
+        'witnesses_not_dict': 0,
+        'witnesses_without_child': 0,
+        ## valid item types
+        'no_id': 0,
+        'child_is_dict': 0,
+        'child_is_list': 0,
+        ## total hits (all witnesses of all valid items)
+        'checks': 0,
+        'total_records': 0,
+        ## collection containers
+        'warnings': ['Warnings from the latest run of `inspect-Records.py`.'],
+        'document_contents': {}, # a "Manuscript Index" to DIMEV, expressed as dict (for each key-value pair, the key is a source identifier, the value is a list of items in that source)
+        'item_records': [] # a selective record of DIMEV items
+        }
+    warning_log = walk['warnings']
+    document_contents = walk['document_contents']
+
+    # walk the source file one record at a time
+    for item in iter_records(source):
+        walk['total_records'] += 1
+        if not has_content(item):
+            msg = 'Unexpected data type. <record> is not a dictionary'
+            warn(msg, warning_log)
+            walk['item_not_dict'] += 1
         else:
-            dimevID = item['@xml:id']
-
-            # extract witness keys
-            if 'witnesses' not in item:
-                msg = f'Unexpected data structure. {dimevID} has no element <witnesses>.'
-                warn(msg, dimevID)
-                missing_witnesses += 1
+            if namespace + 'id' not in item.attrib:
+                walk['no_id'] += 1
             else:
-                if type(item['witnesses']) != dict:
-                    msg = f'Unexpected data type. The element <witnesses> in {dimevID} is not a dictionary.'
-                    warn(msg, dimevID)
-                    witnesses_not_dict += 1
+                dimevID = item.get(namespace + 'id')
+
+                # extract witness keys
+                witnesses_element = item.find('witnesses')
+                if witnesses_element is None:
+                    msg = f'Unexpected data structure. {dimevID} has no element <witnesses>.'
+                    warn(msg, warning_log)
+                    walk['missing_witnesses'] += 1
                 else:
-                    if 'witness' not in item['witnesses']:
-                        msg = f'Unexpected data structure. The element <witnesses> in {dimevID} has no child <witness>.'
-                        warn(msg, dimevID)
-                        witnesses_without_child += 1
+                    if not has_content(witnesses_element):
+                        msg = f'Unexpected data type. The element <witnesses> in {dimevID} is not a dictionary.'
+                        warn(msg, warning_log)
+                        walk['witnesses_not_dict'] += 1
                     else:
-                        witnesses = item['witnesses']['witness']
-                        extracted_item = {'id': dimevID}
-                        if type(witnesses) == dict:
-                            child_is_dict += 1
-                            wit_id = witnesses['source']['@key']
-                            document_contents = create_ms_index(wit_id, dimevID, document_contents)
-                            extracted_item['witnesses'] = [wit_id]
-                            extracted_item['editions'] = get_editions(dimevID, witnesses)
-                            if 'allLines' in witnesses.keys():
-                                extracted_item['editions'] = True # NOTE: Treat single-witness items, fully transcribed by DIMED, as 'edited'
-                            checks += 1
+                        witnesses = witnesses_element.findall('witness')
+                        if not witnesses:
+                            msg = f'Unexpected data structure. The element <witnesses> in {dimevID} has no child <witness>.'
+                            warn(msg, warning_log)
+                            walk['witnesses_without_child'] += 1
                         else:
-                            if type(witnesses) == list:
-                                child_is_list += 1
+                            extracted_item = {'id': dimevID, 'title': get_title(item)}
+                            if len(witnesses) == 1:
+                                walk['child_is_dict'] += 1
+                                witness = witnesses[0]
+                                wit_id = get_source_key(witness)
+                                create_ms_index(wit_id, dimevID, document_contents)
+                                extracted_item['witnesses'] = [wit_id]
+                                extracted_item['editions'] = get_editions(dimevID, witness)
+                                if witness.find('allLines') is not None:
+                                    extracted_item['editions'] = True # NOTE: Treat single-witness items, fully transcribed by DIMED, as 'edited'
+                                walk['checks'] += 1
+                            else:
+                                walk['child_is_list'] += 1
                                 wit_list = []
                                 ed_dict = {}
-                                for idx in range(len(witnesses)):
-                                    wit_id = witnesses[idx]['source']['@key']
-                                    document_contents = create_ms_index(wit_id, dimevID, document_contents)
+                                for witness in witnesses:
+                                    wit_id = get_source_key(witness)
+                                    create_ms_index(wit_id, dimevID, document_contents)
                                     wit_list.append(wit_id)
-                                    ed_dict[wit_id] = get_editions(dimevID, witnesses[idx])
-                                    checks += 1
+                                    ed_dict[wit_id] = get_editions(dimevID, witness)
+                                    walk['checks'] += 1
                                 extracted_item['witnesses'] = wit_list
                                 extracted_item['editions'] = any(ed_dict.values())
-                        item_records.append(extracted_item)
-
-unedited_items = []
-for item in item_records:
-    if not item['editions']:
-        item_id = re.sub('record-', '', item['id'])
-        unedited_items.append(item_id)
-unedited_items.sort(key=float)
-
-# Write summary of counts
-markdown.append('# Summary of walk')
-
-## Gather raw counts
-report_parts = [ \
-    'Total items found: ' + str(len(items)),
-    'Items of type dictionary without `@xml:id` (these are presumed cross-references): ' + str(no_id),
-    'Items with xml:id but no element `witnesses` (these are also presumed cross-refs): ' + str(missing_witnesses),
-    'Items with child-element `witness` of type dictionary: ' + str(child_is_dict),
-    'Items with child-element `witness` of type list: ' + str(child_is_list),
-    'Items with no recorded edition: ' + str(len(unedited_items)),
-    'Total unique item-instances (excluding data errors): ' + str(checks),
-    'Total source keys: ' + str(len(document_contents))
-    ]
-
-## Format raw counts
-markdown.append('## Raw counts')
-n = 1
-for line in report_parts:
-    prefix = str(n) + '. '
-    markdown.append(prefix + line)
-    n += 1
-report_parts.clear()
-
-## Gather interpreted counts
-data_errors = item_not_dict + missing_witnesses + witnesses_not_dict
-valid_items = child_is_dict + child_is_list
-report_parts = [ \
-    'Total valid items, excluding cross-references: ' + str(valid_items)
-    ]
-
-## Format interpreted counts
-markdown.append('\n## Interpretation')
-for line in report_parts:
-    prefix = str(n) + '. '
-    markdown.append(prefix + line)
-    n += 1
-
-## Check sums
-check = len(items) - data_errors - no_id == valid_items
-if not check:
-    msg = 'Unknown data error. Counts do not add up.'
-    warn(msg, '')
-
-## Get input
-prompt = 'Print summary counts to terminal? (y/N) '
-options = ['y', 'n', '']
-job = get_valid_input(prompt, options)
-if job == 'y':
-    for line in markdown:
-        print(line)
-
-# Prepare distributional data (items with n witnesses and vice versa)
-print('\nPreparing distributional data...')
-item_counts = []
-for idx in document_contents:
-    item_counts.append(len(document_contents[idx]))
-max_item_count = max(item_counts)
-n_items = list(range(1, max_item_count + 1))
-
-witnesses_with_n_items = []
-for n in n_items:
-    count = 0
-    for key in document_contents.keys():
-        if len(document_contents[key]) == n:
-            count += 1
-    witnesses_with_n_items.append(count)
-
-
-witness_counts = []
-for item in item_records:
-    witness_counts.append(len(item['witnesses']))
-max_wit_count = max(witness_counts)
-n_witnesses = list(range(1, max_wit_count + 1))
-
-items_with_n_witnesses = []
-for n in n_witnesses:
-    count = 0
-    for item in item_records:
-        if len(item['witnesses']) == n:
-            count += 1
-    items_with_n_witnesses.append(count)
-
-total_witnesses = len(document_contents)
-total_items = len(item_records)
-
-## Calculate and report summaries for items
-markdown.extend(['', '# Summary counts for items', '## Largest fractions'])
-
-### Largest fractions
+                            walk['item_records'].append(extracted_item)
+    return walk
 
-for idx in range(3):
-    msg = '- ' + str(items_with_n_witnesses[idx]) + ' items (' + calc_percent(items_with_n_witnesses[idx], total_items) + ') have ' + str(idx+1) + ' witness/es'
-    markdown.append(msg)
-
-### Upper percentiles
-markdown.extend(['', '## Upper percentiles'])
-threshold_ratios = [.90, .95, .99]
-
-for ratio in threshold_ratios:
-    count = 0
-    for idx in range(len(items_with_n_witnesses)):
-        count += items_with_n_witnesses[idx]
-        if count / total_items > ratio:
-            msg = '- ' + str(int(100 * ratio)) + '% of items have ' + str(n_witnesses[idx-1]) + ' or fewer witnesses'
-            markdown.append(msg)
-            break
-
-### Highest counts
-witness_counts.sort()
-markdown.extend(['', '## Items with highest numbers of witnesses'])
-n = 0
-count_list = []
-while n < 5:
-    count = witness_counts.pop(-1)
-    if count not in count_list:
-        count_list.append(count)
-    n += 1
-hit_list = []
-for count in count_list:
+def get_unedited_items(item_records):
+    unedited_items = []
     for item in item_records:
-        if len(item['witnesses']) == count:
-            hit_list.append(item['id'])
-for dimevID in hit_list:
-    for idx in range(len(items)):
-        item = items[idx]
-        if type(item) == dict and '@xml:id' in item.keys():
-            if item['@xml:id'] == dimevID:
-                if 'titles' in item.keys():
-                    title = item['titles']['title']
-                    if type(title) == list:
-                        title = title[0]
-                if type(title) == str:
-                    title = strip_italics(title)
-    for item in item_records:
-        if item['id'] == dimevID:
-            witness_count = len(item['witnesses'])
-    msg = '- ' + title + ' (' + dimevID + '): ' + str(witness_count)
-    markdown.append(msg)
-
-## Calculate and report summaries for witnesses
-### Largest fractions
-markdown.extend(['', '# Summary counts for witnesses', '## Largest fractions'])
-
-for idx in range(3):
-    msg = '- ' + str(witnesses_with_n_items[idx]) + ' witnesses (' + calc_percent(witnesses_with_n_items[idx], total_witnesses) + ') have ' + str(idx+1) + ' item/s'
-    markdown.append(msg)
-
-### Upper percentiles
-markdown.extend(['', '## Upper percentiles'])
-threshold_ratios = [.85, .90, .95, .99]
-
-for ratio in threshold_ratios:
-    count = 0
-    for idx in range(len(witnesses_with_n_items)):
-        count += witnesses_with_n_items[idx]
-        if count / total_witnesses > ratio:
-            msg = '- ' + str(int(100 * ratio)) + '% of witnesses have ' + str(n_items[idx-1]) + ' or fewer items'
-            markdown.append(msg)
-            break
-
-### Highest counts
-item_counts.sort()
-markdown.extend(['', '## Witness keys with highest numbers of items'])
-n = 0
-while n < 5:
-    count = item_counts.pop(-1)
-    for key in document_contents.keys():
-        if len(document_contents[key]) == count:
-            itemID = key
+        if not item['editions']:
+            item_id = re.sub('record-', '', item['id'])
+            unedited_items.append(item_id)
+    unedited_items.sort(key=float)
+    return unedited_items
+
+def histogram(counts):
+    # List of frequencies of 1, 2, ... max(counts)
+    frequencies = Counter(counts)
+    return [frequencies[n] for n in range(1, max(frequencies) + 1)]
+
+def get_percentiles(with_n, total, threshold_ratios):
+    # For each ratio, the largest n such that the share of entries with n or
+    # fewer is still within the ratio (the value reported is that of the bin
+    # before the one which crosses the threshold)
+    percentiles = []
+    ratios = iter(sorted(threshold_ratios))
+    ratio = next(ratios, None)
+    for idx, count in enumerate(accumulate(with_n)):
+        while ratio is not None and count / total > ratio:
+            percentiles.append((ratio, idx if idx else len(with_n)))
+            ratio = next(ratios, None)
+        if ratio is None:
             break
-    msg = '- ' + itemID + ': ' + str(count)
-    markdown.append(msg)
-    n += 1
-
-# Unprinted items
-
-markdown.extend(['', '# Verse items with no recorded edition', 'References are to DIMEV numbers.', 'This list excludes verse items transmitted in a single witness, transcribed in full in the DIMEV data element "allLines".', ''])
-for item in unedited_items:
-    markdown.append(f'- {item}')
-
-# Write artefacts
-print(f'Writing output to `{dest_dir}`.')
-with open(dest_dir + log_file, 'w') as file:
-    for line in warning_log:
-        file.write(line + '\n')
-print(f'Wrote log of warnings to `{log_file}`.')
-
-markdown.insert(0, 'This file is written by `inspect-Records.py`.\n')
-with open(dest_dir + summary_output, 'w') as file:
-    for line in markdown:
-        file.write(line + '\n')
-print(f'Wrote analysis of distributions to `{summary_output}`.')
-
-print('Goodbye')
+    return percentiles
+
+def get_item_distribution(item_records):
+    # Items with n witnesses
+    witness_counts = [len(item['witnesses']) for item in item_records]
+    items_with_n_witnesses = histogram(witness_counts)
+    total_items = len(item_records)
+    percentiles = get_percentiles(items_with_n_witnesses, total_items, [.90, .95, .99])
+
+    # Items with the highest numbers of witnesses: all items sharing any of
+    # the five highest counts
+    count_list = []
+    for count in heapq.nlargest(5, witness_counts):
+        if count not in count_list:
+            count_list.append(count)
+    hits_by_count = {count: [] for count in count_list}
+    titles = {}
+    records = {}
+    for item in item_records:
+        witness_count = len(item['witnesses'])
+        if witness_count in hits_by_count:
+            hits_by_count[witness_count].append(item['id'])
+        records[item['id']] = item
+        if item['title'] is not None:
+            titles[item['id']] = item['title']
+    highest = []
+    title = ''
+    for count in count_list:
+        for dimevID in hits_by_count[count]:
+            title = titles.get(dimevID, title) # NOTE: an item without a title is reported under the previous title
+            highest.append((dimevID, title, len(records[dimevID]['witnesses'])))
+
+    return {
+        'total': total_items,
+        'with_n': items_with_n_witnesses,
+        'percentiles': percentiles,
+        'highest': highest
+        }
+
+def get_witness_distribution(document_contents):
+    # Witnesses with n items
+    item_counts = [len(items) for items in document_contents.values()]
+    witnesses_with_n_items = histogram(item_counts)
+    total_witnesses = len(document_contents)
+    percentiles = get_percentiles(witnesses_with_n_items, total_witnesses, [.85, .90, .95, .99])
+
+    # Witness keys with the highest numbers of items: for each of the five
+    # highest counts, the first key with that count
+    first_key = {}
+    for key, items in document_contents.items():
+        first_key.setdefault(len(items), key)
+    highest = [(first_key[count], count) for count in heapq.nlargest(5, item_counts)]
+
+    return {
+        'total': total_witnesses,
+        'with_n': witnesses_with_n_items,
+        'percentiles': percentiles,
+        'highest': highest
+        }
+
+def analyse(source=source):
+    """Walk Records.xml and return the statistics behind the summary report,
+    as a dictionary:
+
+        walk counts     total_records, no_id, missing_witnesses,
+                        witnesses_not_dict, witnesses_without_child,
+                        item_not_dict, child_is_dict, child_is_list, checks
+        document_contents, item_records, warnings
+                        as collected by the walk
+        unedited_items  DIMEV numbers of items with no recorded edition
+        valid_items, data_errors
+        items, witnesses
+                        distributions: {'total', 'with_n' (count with 1, 2, ...
+                        witnesses/items), 'percentiles' [(ratio, n)],
+                        'highest' [(id, title, count)] or [(key, count)]}
+    """
+    stats = walk_records(source)
+    stats['unedited_items'] = get_unedited_items(stats['item_records'])
+    stats['data_errors'] = stats['item_not_dict'] + stats['missing_witnesses'] + stats['witnesses_not_dict']
+    stats['valid_items'] = stats['child_is_dict'] + stats['child_is_list']
+
+    ## Check sums
+    check = stats['total_records'] - stats['data_errors'] - stats['no_id'] == stats['valid_items']
+    if not check:
+        msg = 'Unknown data error. Counts do not add up.'
+        warn(msg, stats['warnings'])
+
+    # Prepare distributional data (items with n witnesses and vice versa)
+    print('Preparing distributional data...')
+    stats['items'] = get_item_distribution(stats['item_records'])
+    stats['witnesses'] = get_witness_distribution(stats['document_contents'])
+    return stats
+
+def render_summary(stats):
+    # Write summary of counts
+    markdown = ['# Summary of walk']
+
+    ## Gather raw counts
+    report_parts = [ \
+        'Total items found: ' + str(stats['total_records']),
+        'Items of type dictionary without `@xml:id` (these are presumed cross-references): ' + str(stats['no_id']),
+        'Items with xml:id but no element `witnesses` (these are also presumed cross-refs): ' + str(stats['missing_witnesses']),
+        'Items with child-element `witness` of type dictionary: ' + str(stats['child_is_dict']),
+        'Items with child-element `witness` of type list: ' + str(stats['child_is_list']),
+        'Items with no recorded edition: ' + str(len(stats['unedited_items'])),
+        'Total unique item-instances (excluding data errors): ' + str(stats['checks']),
+        'Total source keys: ' + str(len(stats['document_contents']))
+        ]
+
+    ## Format raw counts
+    markdown.append('## Raw counts')
+    n = 1
+    for line in report_parts:
+        prefix = str(n) + '. '
+        markdown.append(prefix + line)
+        n += 1
+
+    ## Gather interpreted counts
+    report_parts = [ \
+        'Total valid items, excluding cross-references: ' + str(stats['valid_items'])
+        ]
+
+    ## Format interpreted counts
+    markdown.append('\n## Interpretation')
+    for line in report_parts:
+        prefix = str(n) + '. '
+        markdown.append(prefix + line)
+        n += 1
+    return markdown
+
+def render_markdown(stats):
+    markdown = ['This file is written by `inspect-Records.py`.\n']
+    markdown.extend(render_summary(stats))
+
+    ## Calculate and report summaries for items
+    items = stats['items']
+    markdown.extend(['', '# Summary counts for items', '## Largest fractions'])
+
+    ### Largest fractions
+    for idx in range(3):
+        msg = '- ' + str(items['with_n'][idx]) + ' items (' + calc_percent(items['with_n'][idx], items['total']) + ') have ' + str(idx+1) + ' witness/es'
+        markdown.append(msg)
+
+    ### Upper percentiles
+    markdown.extend(['', '## Upper percentiles'])
+    for ratio, n in items['percentiles']:
+        msg = '- ' + str(int(100 * ratio)) + '% of items have ' + str(n) + ' or fewer witnesses'
+        markdown.append(msg)
+
+    ### Highest counts
+    markdown.extend(['', '## Items with highest numbers of witnesses'])
+    for dimevID, title, witness_count in items['highest']:
+        msg = '- ' + title + ' (' + dimevID + '): ' + str(witness_count)
+        markdown.append(msg)
+
+    ## Calculate and report summaries for witnesses
+    witnesses = stats['witnesses']
+    ### Largest fractions
+    markdown.extend(['', '# Summary counts for witnesses', '## Largest fractions'])
+    for idx in range(3):
+        msg = '- ' + str(witnesses['with_n'][idx]) + ' witnesses (' + calc_percent(witnesses['with_n'][idx], witnesses['total']) + ') have ' + str(idx+1) + ' item/s'
+        markdown.append(msg)
+
+    ### Upper percentiles
+    markdown.extend(['', '## Upper percentiles'])
+    for ratio, n in witnesses['percentiles']:
+        msg = '- ' + str(int(100 * ratio)) + '% of witnesses have ' + str(n) + ' or fewer items'
+        markdown.append(msg)
+
+    ### Highest counts
+    markdown.extend(['', '## Witness keys with highest numbers of items'])
+    for itemID, count in witnesses['highest']:
+        msg = '- ' + itemID + ': ' + str(count)
+        markdown.append(msg)
+
+    # Unprinted items
+    markdown.extend(['', '# Verse items with no recorded edition', 'References are to DIMEV numbers.', 'This list excludes verse items transmitted in a single witness, transcribed in full in the DIMEV data element "allLines".', ''])
+    for item in stats['unedited_items']:
+        markdown.append(f'- {item}')
+    return markdown
+
+def write_artefacts(stats, dest_dir):
+    print(f'Writing output to `{dest_dir}`.')
+    with open(os.path.join(dest_dir, log_file), 'w') as file:
+        for line in stats['warnings']:
+            file.write(line + '\n')
+    print(f'Wrote log of warnings to `{log_file}`.')
+
+    with open(os.path.join(dest_dir, summary_output), 'w') as file:
+        for line in render_markdown(stats):
+            file.write(line + '\n')
+    print(f'Wrote analysis of distributions to `{summary_output}`.')
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize the distribution of items and witnesses in Records.xml.')
+    parser.add_argument('--source', default=source, help='records file (default: %(default)s)')
+    parser.add_argument('--dest-dir', default=dest_dir, help='directory for the report and warnings (default: %(default)s)')
+    parser.add_argument('--print-summary', action=argparse.BooleanOptionalAction, default=None,
+                        help='print the summary counts to the terminal (default: ask, if run interactively)')
+    args = parser.parse_args()
+
+    stats = analyse(args.source)
+
+    print_summary = args.print_summary
+    if print_summary is None and sys.stdin.isatty():
+        ## Get input
+        prompt = 'Print summary counts to terminal? (y/N) '
+        options = ['y', 'n', '']
+        print_summary = get_valid_input(prompt, options) == 'y'
+    if print_summary:
+        for line in render_summary(stats):
+            print(line)
+
+    write_artefacts(stats, args.dest_dir)
+    print('Goodbye')
+
+if __name__ == '__main__':
+    main()
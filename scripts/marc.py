@@ -0,0 +1,156 @@
+"""MARC record accessor and helpers shared by the printed-book scripts.
+
+The ESTC download gives each MARC record as a dict, tag -> list of fields: a
+control field (001, 008) is a string, a data field a dict whose "subfields"
+map a code to a list of values. The printed-book passes used to walk those
+dicts themselves, each in its own way. MarcRecord wraps one record and decodes
+the fields they use on first access, keeping the result:
+
+    control_number        001
+    title_a, title_b      245 $a and $b, each joined and stripped
+    title                 245 $a $b as one transcribed title
+    place, publisher      first 260 $a and $b, or None
+    date_statement        first 260 $c, or ""
+    date_type, date1, date2
+                          008/06, 008/07-10 and 008/11-14 (stripped)
+
+estc_store.lookup() wraps every record it returns, once per run, so all the
+passes in a process share the decoded fields.
+
+Also here are the two helpers every printed-book script used to copy:
+get_idno() for the TEI side and norm() for comparing titles.
+"""
+
+import re
+
+TEI = '{http://www.tei-c.org/ns/1.0}'
+
+_UNSET = object()
+
+
+# ---------------------------------------------------------------------------
+# MARC records
+# ---------------------------------------------------------------------------
+
+class MarcRecord:
+    """One MARC record, its fields decoded lazily and kept."""
+
+    __slots__ = ("fields", "_245", "_260", "_008")
+
+    def __init__(self, fields):
+        self.fields = fields
+        self._245 = self._260 = self._008 = _UNSET
+
+    def __contains__(self, tag):
+        return tag in self.fields
+
+    def control(self, tag):
+        """The first value of a control field, or ""."""
+        values = self.fields.get(tag)
+        return values[0] if values else ""
+
+    def subfield(self, tag, code):
+        """The values of `code` in the first instance of field `tag`."""
+        fields = self.fields.get(tag)
+        return fields[0]["subfields"].get(code, []) if fields else []
+
+    def main_entry(self, tag):
+        """The $a of a name field (100, 110, ...), with the trailing
+        cataloguer's punctuation stripped."""
+        a = self.fields[tag][0]["subfields"].get("a", [""])
+        return a[0].strip().strip(".,").strip() if a else ""
+
+    @property
+    def control_number(self):
+        return self.fields["001"][0]
+
+    # 245 -------------------------------------------------------------------
+
+    def _decode_245(self):
+        if self._245 is _UNSET:
+            self._245 = (" ".join(self.subfield("245", "a")),
+                         " ".join(self.subfield("245", "b")))
+        return self._245
+
+    @property
+    def title_a(self):
+        return self._decode_245()[0].strip()
+
+    @property
+    def title_b(self):
+        return self._decode_245()[1].strip()
+
+    @property
+    def title(self):
+        """245 $a followed by $b, as transcribed."""
+        a, b = self._decode_245()
+        return (a + " " + b).strip() if b else a.strip()
+
+    # 260 -------------------------------------------------------------------
+
+    def _decode_260(self):
+        if self._260 is _UNSET:
+            firsts = []
+            for code in "abc":
+                values = self.subfield("260", code)
+                firsts.append(values[0] if values else None)
+            self._260 = tuple(firsts)
+        return self._260
+
+    @property
+    def place(self):
+        return self._decode_260()[0]
+
+    @property
+    def publisher(self):
+        return self._decode_260()[1]
+
+    @property
+    def date_statement(self):
+        return self._decode_260()[2] or ""
+
+    # 008 -------------------------------------------------------------------
+
+    def _decode_008(self):
+        if self._008 is _UNSET:
+            f008 = self.control("008")
+            self._008 = (f008[6:7], f008[7:11], f008[11:15].strip())
+        return self._008
+
+    @property
+    def date_type(self):
+        return self._decode_008()[0]
+
+    @property
+    def date1(self):
+        return self._decode_008()[1]
+
+    @property
+    def date2(self):
+        return self._decode_008()[2]
+
+
+# ---------------------------------------------------------------------------
+# Printed-book helpers
+# ---------------------------------------------------------------------------
+
+def get_idno(monogr, type_):
+    """The text of the first <idno> of this @type in a <monogr>, or ""."""
+    for ref in monogr.findall(TEI + "idno"):
+        if ref.get("type") == type_:
+            return ref.text or ""
+    return ""
+
+
+def norm(s):
+    """Fold the incidental differences (case, ampersand/[and], brackets,
+    truncation marks, punctuation, whitespace) so the comparison ranks on
+    substantive divergence, not transcription conventions."""
+    s = s.lower()
+    s = s.replace("…", " ")
+    s = re.sub(r"\.\.\.", " ", s)
+    s = re.sub(r"\[and\]|\[et\]|&", " and ", s)
+    s = re.sub(r"[\[\]]", "", s)          # drop brackets, keep the content
+    s = re.sub(r"[^\w\s]", " ", s)        # drop punctuation
+    s = re.sub(r"\s+", " ", s).strip()
+    return s
@@ -1,8 +1,28 @@
+# Queries and exports over the DIMEV data files.
+#
+#   python3 query.py find --mss BLHar2253 --subject 'love lyrics'
+#   python3 query.py values subject
+#   python3 query.py names          # export person names to artefacts/
+#   python3 query.py shelfmarks     # export manuscript shelfmarks to artefacts/
+#
+# `find` answers from inverted indexes over Records.xml, kept in `.cache/`.
+# Every filter must match (repeat a filter to require several values); values
+# are compared case-insensitively, with whitespace collapsed. When Records.xml
+# changes, only the records whose text has changed are re-parsed: the others
+# keep their index entries.
+
+import argparse
+import hashlib
+import mmap
 import os
+import pickle
 from lxml import etree
 import csv
 import re
 
+import corpus
+import record_index
+
 # top-level variables
 
 src_dir = '../../dimev/data/'
@@ -11,20 +31,194 @@ ManuscriptsXML = 'Manuscripts.xml'
 RecordsXML = 'Records.xml'
 namespace = '{http://www.w3.org/XML/1998/namespace}'
 
-def main():
-    MStree = etree.parse(src_dir + ManuscriptsXML)
-    MSroot = MStree.getroot()
-    tree = etree.parse(src_dir + RecordsXML)
-    root = tree.getroot()
+# Indexed fields: command-line option -> help text
+index_fields = {
+    'author': 'author name (full name or surname)',
+    'scribe': 'scribe name (full name or surname)',
+    'subject': 'subject term',
+    'form': 'verse form term',
+    'repertory': 'repertory number, as KEY:NUMBER (e.g. NIMEV:1234, IMEV:12) or NUMBER in any repertory',
+    'mss': 'key of a witness source (or other mss reference)',
+    'bibl': 'key of any bibliographic reference',
+    }
 
-    ## Export manuscript shelfmarks as csv
-    #export_shelfmarks_as_csv(MSroot)
+# Common names for the repertory keys used in Records.xml
+repertory_aliases = {
+    'Brown1943': 'IMEV',
+    'Robbins1965b': 'Supplement',
+    'Ringler1988': 'TP',
+    'Ringler1992': 'TM',
+    }
+
+query_index_file = corpus.CACHE_DIR / 'Records.xml.query-index.pickle'
+query_index_version = 1
+
+def main():
+    parser = argparse.ArgumentParser(description='Query and export the DIMEV data files.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    find_parser = commands.add_parser('find', help='find records matching every filter given')
+    for field, help_text in index_fields.items():
+        find_parser.add_argument('--' + field, action='append', default=[], metavar='VALUE', help=help_text)
+    values_parser = commands.add_parser('values', help='list the indexed values of a field, with record counts')
+    values_parser.add_argument('field', choices=list(index_fields))
+    commands.add_parser('names', help='export person names to ' + write_dir)
+    commands.add_parser('shelfmarks', help='export manuscript shelfmarks to ' + write_dir)
+    args = parser.parse_args()
 
-    # Export person names
-    retrieve_person_names(root)
+    if args.command == 'find':
+        filters = [(field, value) for field in index_fields for value in getattr(args, field)]
+        if not filters:
+            find_parser.error('give at least one filter')
+        index = load_query_index(src_dir + RecordsXML)
+        hits = find_records(index, filters)
+        for dimev_id in hits:
+            print(f"{dimev_id}\t{index['records'][dimev_id]['name']}")
+        print(f'{len(hits)} records')
+    elif args.command == 'values':
+        index = load_query_index(src_dir + RecordsXML)
+        for value, ids in sorted(index['fields'][args.field].items()):
+            print(f'{len(ids):6}  {value}')
+    elif args.command == 'names':
+        root = corpus.load(src_dir + RecordsXML).getroot()
+        retrieve_person_names(root)
+    elif args.command == 'shelfmarks':
+        MSroot = corpus.load(src_dir + ManuscriptsXML).getroot()
+        export_shelfmarks_as_csv(MSroot)
 
     print('Goodbye')
 
+def normalize_value(string):
+    return ' '.join(string.split()).casefold()
+
+def element_text(elem):
+    if elem is None:
+        return ''
+    return normalize_value(''.join(elem.itertext()))
+
+def display_text(elem):
+    if elem is None:
+        return ''
+    return ' '.join(''.join(elem.itertext()).split())
+
+def extract_index_terms(record):
+    # Values of each indexed field in one <record>
+    terms = {field: set() for field in index_fields}
+    for elem in record.iter('author', 'scribe'):
+        parts = [element_text(elem.find(tag)) for tag in ('first', 'last', 'suffix')]
+        full_name = ' '.join(part for part in parts if part)
+        if full_name:
+            terms[elem.tag].add(full_name)
+        if parts[1]:
+            terms[elem.tag].add(parts[1])
+    for elem in record.iter('subject'):
+        terms['subject'].add(element_text(elem))
+    for elem in record.iter('verseForm'):
+        terms['form'].add(element_text(elem))
+    repertories = record.find('repertories')
+    if repertories is not None:
+        for citation in repertories.iter('bibl'):
+            number = element_text(citation)
+            key = citation.get('key')
+            if number and key:
+                terms['repertory'].add(number)
+                terms['repertory'].add(normalize_value(f'{key}:{number}'))
+                if key in repertory_aliases:
+                    terms['repertory'].add(normalize_value(f'{repertory_aliases[key]}:{number}'))
+    for elem in record.iter('source', 'mss'):
+        if elem.get('key'):
+            terms['mss'].add(normalize_value(elem.get('key')))
+    for elem in record.iter('bibl'):
+        if elem.get('key'):
+            terms['bibl'].add(normalize_value(elem.get('key')))
+    for field in terms:
+        terms[field].discard('')
+    return terms
+
+def load_query_index(source):
+    # Bring the persisted index up to date with `source` and return it. If the
+    # file is unchanged the index is used as is; otherwise each record's text
+    # is hashed and only new or changed records are parsed.
+    digest = corpus.fingerprint(source)[2]
+    index = read_query_index()
+    if index is not None and index['digest'] == digest:
+        return index
+    if index is None:
+        index = {'version': query_index_version, 'digest': None, 'records': {},
+                 'fields': {field: {} for field in index_fields}}
+
+    spans = record_index.load_index(source)['spans']
+    seen = set()
+    parsed = 0
+    with open(source, 'rb') as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        for position, (start, end, dimev_id) in enumerate(spans):
+            if dimev_id is None: # cross-references without xml:id are not indexed
+                continue
+            seen.add(dimev_id)
+            data = buf[start:end]
+            sha256 = hashlib.sha256(data).hexdigest()
+            entry = index['records'].get(dimev_id)
+            if entry is not None and entry['sha256'] == sha256:
+                entry['position'] = position
+                continue
+            if entry is not None:
+                remove_postings(index, dimev_id, entry['terms'])
+            record = etree.fromstring(data)
+            terms = extract_index_terms(record)
+            index['records'][dimev_id] = {
+                'sha256': sha256,
+                'position': position,
+                'name': display_text(record.find('name')),
+                'terms': terms,
+                }
+            for field, values in terms.items():
+                for value in values:
+                    index['fields'][field].setdefault(value, set()).add(dimev_id)
+            parsed += 1
+    removed = [dimev_id for dimev_id in index['records'] if dimev_id not in seen]
+    for dimev_id in removed:
+        remove_postings(index, dimev_id, index['records'].pop(dimev_id)['terms'])
+    index['digest'] = digest
+    write_query_index(index)
+    print(f'Updated query index: {parsed} records indexed, {len(removed)} removed, {len(index["records"]) - parsed} unchanged')
+    return index
+
+def remove_postings(index, dimev_id, terms):
+    for field, values in terms.items():
+        postings = index['fields'][field]
+        for value in values:
+            ids = postings.get(value)
+            if ids is not None:
+                ids.discard(dimev_id)
+                if not ids:
+                    del postings[value]
+
+def read_query_index():
+    try:
+        with open(query_index_file, 'rb') as file:
+            index = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    if index.get('version') != query_index_version:
+        return None
+    return index
+
+def write_query_index(index):
+    corpus.CACHE_DIR.mkdir(exist_ok=True)
+    tmp = query_index_file.with_suffix('.tmp')
+    with open(tmp, 'wb') as file:
+        pickle.dump(index, file, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, query_index_file)
+
+def find_records(index, filters):
+    # Ids of the records matching every (field, value) filter, in document order
+    hits = None
+    for field, value in filters:
+        ids = index['fields'][field].get(normalize_value(value), set())
+        hits = set(ids) if hits is None else hits & ids
+        if not hits:
+            return []
+    return sorted(hits, key=lambda dimev_id: index['records'][dimev_id]['position'])
+
 def print_to_csv(data, csv_file):
     with open(write_dir + csv_file, 'w', newline='') as file:
         writer = csv.writer(file, lineterminator='\n')
@@ -34,47 +228,42 @@ def print_to_csv(data, csv_file):
 
 def retrieve_person_names(root):
     print('Retrieving person names from Records.xml...')
-    data = []
-    column_labels = ['firstname', 'lastname', 'suffix']
-    data.append(column_labels)
-    target_tags = ['author', 'scribe']
-    for elem in root.iter():
-        if elem.tag in target_tags:
-            # retrieve elements
-            firstname = elem.find('first')
-            lastname = elem.find('last')
-            suffix = elem.find('suffix')
-            name_parts = [firstname, lastname, suffix]
-
-            # create a container
-            new_name = []
-
-            # retrieve text content
-            for part in name_parts:
-                if part is not None:
-                    text = str(part.text)
-                    text = clean_text(text)
-                else:
-                    text = ''
-                new_name.append(text)
-
-            # add to list, if not already present
-
-            if new_name in data:
-                continue
-            else:
-                data.append(new_name)
+    # (firstname, lastname, suffix) -> [occurrences, {record id: None}], in
+    # order of first appearance; the inner dict keeps the record ids unique
+    # and in document order
+    names = {}
+    for record in root.iter('record'):
+        dimev_id = record.get(namespace + 'id', '')
+        for elem in record.iter('author', 'scribe'):
+            new_name = tuple(get_name_part(elem, tag) for tag in ('first', 'last', 'suffix'))
+            entry = names.get(new_name)
+            if entry is None:
+                entry = names[new_name] = [0, {}]
+            entry[0] += 1
+            if dimev_id:
+                entry[1][dimev_id] = None
 
-    count = len(data) - 1
-    print(f'Found {count} unique names')
+    data = [['firstname', 'lastname', 'suffix', 'occurrences', 'records']]
+    for new_name, (occurrences, record_ids) in names.items():
+        data.append([*new_name, occurrences, ' '.join(record_ids)])
+
+    print(f'Found {len(names)} unique names')
 
     # print to csv
     csv_file = 'person-names.csv'
     print_to_csv(data, csv_file)
 
+def get_name_part(elem, tag):
+    part = elem.find(tag)
+    if part is None:
+        return ''
+    return clean_text(str(part.text))
+
+runs_of_spaces = re.compile(' +')
+
 def clean_text(string):
-    string = re.sub(r'\n', '', string)
-    string = re.sub(' +', ' ', string)
+    string = string.replace('\n', '')
+    string = runs_of_spaces.sub(' ', string)
     return string
 
 def export_shelfmarks_as_csv(root):
@@ -128,4 +317,5 @@ def remove_whitespace(text_str):
     text_str = re.sub(r'\n', '', text_str)
     return text_str
 
-main()
+if __name__ == '__main__':
+    main()
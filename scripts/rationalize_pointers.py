@@ -42,6 +42,8 @@ from pathlib import Path
 
 from lxml import etree
 
+import corpus
+
 TEI = "http://www.tei-c.org/ns/1.0"
 
 DIMEV_RECORDS = Path("../../dimev/data/Records.xml")
@@ -79,8 +81,7 @@ def rename_refs(root, ref_tag, ptr_tag):
 
 
 def write(tree, path):
-    etree.indent(tree, space="    ", level=0)
-    tree.write(str(path), pretty_print=True, xml_declaration=True, encoding="UTF-8")
+    corpus.write(tree, path)
     print(f"Wrote {path}")
 
 
@@ -91,12 +92,12 @@ def main():
     args = ap.parse_args()
 
     # Records.xml -- unqualified element names.
-    rec_tree = etree.parse(str(DIMEV_RECORDS))
+    rec_tree = corpus.load(DIMEV_RECORDS)
     rec_internal, rec_external = rename_refs(rec_tree.getroot(), "ref", "ptr")
 
     # Manuscripts.xml -- TEI namespace; all `ref`s are catalogue/surrogate
     # wrappers carrying absolute URIs.
-    mss_tree = etree.parse(str(DIMEV_MSS))
+    mss_tree = corpus.load(DIMEV_MSS)
     mss_internal, mss_external = rename_refs(
         mss_tree.getroot(), f"{{{TEI}}}ref", f"{{{TEI}}}ptr")
 
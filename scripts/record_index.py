@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+"""Byte-offset index of Records.xml, for reading single records without a parse.
+
+Looking up one record used to mean parsing the whole of Records.xml. This
+module scans the file once, without parsing it, and records the byte range of
+every top-level <record> and every <witness>:
+
+    records     xml:id -> (start, end)          e.g. "record-1713"
+    witnesses   xml:id -> (start, end, record)  e.g. "wit-1713-3"
+    spans       [(start, end, xml:id or None)]  every record, in document order,
+                                                cross-references included
+
+A lookup maps the file, slices out the range and parses the slice alone, so
+fetching a handful of records costs milliseconds however large the file is.
+
+The scan is a regular expression over the raw bytes, not an XML parse. It skips
+comments (Records.xml keeps dead records inside them) and relies on the file
+being what the schema makes it: <record> elements are children of the root and
+never nested, and start tags contain no ">" inside attribute values.
+
+The index is kept through corpus.cached(), keyed by the content hash of the
+file: an edit to Records.xml invalidates it, and the next lookup rescans.
+
+Usage:
+    python3 record_index.py                          # build the index, print counts
+    python3 record_index.py record-1713 wit-13-1     # print the records / witnesses
+"""
+
+import argparse
+import mmap
+import re
+import sys
+
+from lxml import etree
+
+import corpus
+
+# One alternation, so a comment is consumed whole before any tag inside it
+# can match. Group 1 is the closing slash, 2 the tag name, 3 the attributes,
+# 4 the slash of an empty-element tag.
+TAG_RE = re.compile(
+    rb"<!--.*?-->|<(/?)(record|witness)\b([^>]*?)(/?)>", re.DOTALL
+)
+ID_RE = re.compile(rb"""\bxml:id\s*=\s*(["'])(.*?)\1""")
+
+
+# ---------------------------------------------------------------------------
+# Building
+# ---------------------------------------------------------------------------
+
+def get_id(attrs):
+    m = ID_RE.search(attrs)
+    return m.group(2).decode("utf-8") if m else None
+
+
+def scan(buf):
+    """Index the records and witnesses in `buf` (bytes or mmap)."""
+    records = {}
+    witnesses = {}
+    spans = []
+    record = None   # (start, xml:id) of the open record
+    witness = None  # (start, xml:id) of the open witness
+    for m in TAG_RE.finditer(buf):
+        tag = m.group(2)
+        if tag is None:  # comment
+            continue
+        closing, empty = m.group(1), m.group(4)
+        if tag == b"record":
+            if closing:
+                if record is None:
+                    raise ValueError(f"unmatched </record> at byte {m.start()}")
+                start, xml_id = record
+                spans.append((start, m.end(), xml_id))
+                if xml_id is not None:
+                    records[xml_id] = (start, m.end())
+                record = None
+            else:
+                if record is not None:
+                    raise ValueError(f"<record> nested in {record[1]} at byte {m.start()}")
+                xml_id = get_id(m.group(3))
+                if empty:
+                    spans.append((m.start(), m.end(), xml_id))
+                    if xml_id is not None:
+                        records[xml_id] = (m.start(), m.end())
+                else:
+                    record = (m.start(), xml_id)
+        else:
+            if closing:
+                if witness is not None:
+                    start, xml_id = witness
+                    witnesses[xml_id] = (start, m.end(), record[1] if record else None)
+                    witness = None
+            else:
+                xml_id = get_id(m.group(3))
+                if xml_id is None:
+                    continue
+                if empty:
+                    witnesses[xml_id] = (m.start(), m.end(), record[1] if record else None)
+                else:
+                    witness = (m.start(), xml_id)
+    if record is not None:
+        raise ValueError(f"unclosed <record> {record[1]} at byte {record[0]}")
+    return {"records": records, "witnesses": witnesses, "spans": spans}
+
+
+def build_index(path):
+    with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        return scan(buf)
+
+
+def load_index(path=corpus.RECORDS):
+    """The index of `path`, rebuilt only when the file has changed."""
+    return corpus.cached(path, "record-index", build_index, parse=False)
+
+
+# ---------------------------------------------------------------------------
+# Lookup
+# ---------------------------------------------------------------------------
+
+def span(xml_id, index):
+    """(start, end) of a record or witness id, or None."""
+    hit = index["records"].get(xml_id) or index["witnesses"].get(xml_id)
+    return hit[:2] if hit else None
+
+
+def read_slices(ranges, path=corpus.RECORDS):
+    """The bytes of each (start, end) range, read through one mapping."""
+    with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        return [buf[start:end] for start, end in ranges]
+
+
+def fetch_raw(ids, path=corpus.RECORDS):
+    """{xml:id: bytes} for the record and witness ids found in the index."""
+    index = load_index(path)
+    found = {xml_id: span(xml_id, index) for xml_id in ids}
+    found = {xml_id: rng for xml_id, rng in found.items() if rng}
+    return dict(zip(found, read_slices(found.values(), path)))
+
+
+def fetch(ids, path=corpus.RECORDS):
+    """{xml:id: element} for the record and witness ids found in the index.
+    Each slice is parsed on its own; the rest of the file is never read."""
+    return {xml_id: etree.fromstring(raw) for xml_id, raw in fetch_raw(ids, path).items()}
+
+
+def fetch_one(xml_id, path=corpus.RECORDS):
+    """The <record> or <witness> with this xml:id, or None."""
+    return fetch([xml_id], path).get(xml_id)
+
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("ids", nargs="*", help="record or witness xml:ids to print")
+    ap.add_argument("--source", default=str(corpus.RECORDS), help="records file (default: %(default)s)")
+    args = ap.parse_args()
+
+    if not args.ids:
+        index = load_index(args.source)
+        print(f"{args.source}: {len(index['spans'])} records "
+              f"({len(index['records'])} with xml:id), {len(index['witnesses'])} witnesses")
+        return
+
+    found = fetch_raw(args.ids, args.source)
+    missing = [xml_id for xml_id in args.ids if xml_id not in found]
+    for xml_id in args.ids:
+        if xml_id in found:
+            sys.stdout.write(found[xml_id].decode("utf-8") + "\n")
+    if missing:
+        print(f"Not in index: {', '.join(missing)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
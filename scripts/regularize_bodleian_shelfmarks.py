@@ -39,6 +39,8 @@ from pathlib import Path
 
 from lxml import etree
 
+import corpus
+
 TEI = "http://www.tei-c.org/ns/1.0"
 XML = "http://www.w3.org/XML/1998/namespace"
 NS = {"t": TEI}
@@ -130,8 +132,7 @@ def main():
         sys.exit(1)
     print("Fold cross-check: OK (rules reproduce every matched Bodleian shelfmark).")
 
-    parser = etree.XMLParser(remove_blank_text=True)
-    tree = etree.parse(str(DIMEV_MSS), parser)
+    tree = corpus.load(DIMEV_MSS, remove_blank_text=True)
     root = tree.getroot()
 
     folds, spaces = [], []  # (xml_id, old, new)
@@ -163,9 +164,7 @@ def main():
           f"({len(folds)} folded, {len(spaces)} spaced).")
 
     if args.write:
-        etree.indent(tree, space=4 * " ", level=0)
-        tree.write(str(DIMEV_MSS), pretty_print=True,
-                   xml_declaration=True, encoding="UTF-8")
+        corpus.write(tree, DIMEV_MSS)
         print(f"Wrote {DIMEV_MSS}")
     else:
         print("Dry run; pass --write to apply.")
@@ -33,6 +33,8 @@ import logging
 import os
 import re
 
+import corpus
+
 # ---------------------------------------------------------------------------
 # CONFIGURATION
 # ---------------------------------------------------------------------------
@@ -200,8 +202,7 @@ def main():
     )
     args = parser.parse_args()
 
-    parser_obj = etree.XMLParser(remove_blank_text=True)
-    tree = etree.parse(SOURCE_FILE, parser_obj)
+    tree = corpus.load(SOURCE_FILE, remove_blank_text=True)
     root = tree.getroot()
 
     tally = Counter()
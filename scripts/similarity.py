@@ -0,0 +1,68 @@
+"""difflib scores for the printed-book title comparisons, bounded before computed.
+
+compare_titles buckets each DIMEV/MARC title pair by SequenceMatcher.ratio(),
+and title_continuation measures how much of MARC 245 $a and $b a DIMEV title
+carries with get_matching_blocks(). A full alignment is quadratic in the title
+length, and most pairs do not need one:
+
+  - identical strings score 1.0, and a needle found whole in the haystack is
+    covered entirely, so neither needs aligning;
+  - every score is bounded above by what the lengths allow (difflib's
+    real_quick_ratio) and by the characters the two strings share, counted
+    as multisets (quick_ratio), so a pair whose bound falls below the
+    caller's floor is settled without an alignment.
+
+Each function returns exactly what difflib would, or None when a bound
+proves the score below `floor`.
+
+The shortcuts hold only while difflib's "popular character" heuristic is off,
+which it is for a second sequence under 200 characters. Past that, difflib
+may junk common characters and score a substring below 1.0, so longer strings
+are always aligned in full. The bounds hold either way.
+"""
+
+import difflib
+from collections import Counter
+
+# SequenceMatcher turns on its autojunk heuristic from this length of b.
+AUTOJUNK_MIN = 200
+
+
+def shared_chars(a, b):
+    """The number of characters a and b have in common, as multisets: an
+    upper bound on the characters any alignment can match."""
+    if len(a) > len(b):
+        a, b = b, a
+    counts = Counter(b)
+    return sum(min(n, counts[ch]) for ch, n in Counter(a).items())
+
+
+def ratio(a, b, floor=0.0):
+    """SequenceMatcher(None, a, b).ratio(), or None if it is below `floor`."""
+    total = len(a) + len(b)
+    if a == b and len(b) < AUTOJUNK_MIN:
+        return 1.0
+    if floor > 0.0:
+        if 2.0 * min(len(a), len(b)) / total < floor:
+            return None
+        if 2.0 * shared_chars(a, b) / total < floor:
+            return None
+    score = difflib.SequenceMatcher(None, a, b).ratio()
+    return score if score >= floor else None
+
+
+def coverage(needle, haystack, floor=0.0):
+    """Fraction of `needle` matched, in order, inside `haystack` by difflib's
+    matching blocks, or None if it is below `floor`."""
+    if not needle:
+        return 0.0 if floor <= 0.0 else None
+    if len(haystack) < AUTOJUNK_MIN and needle in haystack:
+        return 1.0
+    if floor > 0.0:
+        if min(len(needle), len(haystack)) / len(needle) < floor:
+            return None
+        if shared_chars(needle, haystack) / len(needle) < floor:
+            return None
+    sm = difflib.SequenceMatcher(None, needle, haystack)
+    score = sum(size for _, _, size in sm.get_matching_blocks()) / len(needle)
+    return score if score >= floor else None
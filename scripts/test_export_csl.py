@@ -0,0 +1,37 @@
+"""Checks for export_csl.py. Run from scripts/ with: python3 -m pytest -q"""
+
+from lxml import etree
+
+import export_csl
+import update_bibl_as_rdf
+
+ITEM = """<bib:Book xmlns:bib="http://purl.org/net/biblio#"
+ xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+ xmlns:z="http://www.zotero.org/namespaces/export#"
+ xmlns:dc="http://purl.org/dc/elements/1.1/" rdf:about="#item_1">
+    <z:itemType>book</z:itemType>
+    <dc:description>{}</dc:description>
+</bib:Book>"""
+
+
+def test_number_lines_agree_with_update_bibl_as_rdf():
+    for extra in ["Number: 10-11, 13", "Number: 12\nReprinted 1960.",
+                  "Number: 10-11, 13 (in two parts)", "Number: forthcoming"]:
+        item = export_csl.rdf_item(etree.fromstring(ITEM.format(extra)), set())
+        numbers, cleaned = update_bibl_as_rdf.extract_numbers_and_clean(extra)
+        assert item.get("collection-number") == (", ".join(numbers) or None)
+        assert item.get("note") == (cleaned or None)
+
+
+def test_duplicate_ids_across_sources_are_errors(tmp_path, monkeypatch):
+    def items(ids):
+        return lambda path: ({"id": i, "type": "book"} for i in ids)
+    monkeypatch.setattr(export_csl, "SOURCES", {
+        "bibliography": (tmp_path, items(["Robbins1952", "STC5082"])),
+        "printed": (tmp_path, items(["STC5082", "STC5083"])),
+    })
+
+    index, errors = export_csl.export(tmp_path / "csl", validate=False)
+
+    assert [shard["items"] for shard in index["shards"]] == [2, 2]
+    assert errors == [("printed-0001.json", "STC5082", "id already used in bibliography-0001.json")]
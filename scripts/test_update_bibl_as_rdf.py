@@ -0,0 +1,43 @@
+"""Checks for update_bibl_as_rdf.py. Run from scripts/ with: python3 -m pytest -q"""
+
+from rdflib import Graph, Literal, URIRef
+from rdflib.namespace import DC
+
+import update_bibl_as_rdf
+
+BIBLIOGRAPHY = """<?xml version="1.0" encoding="UTF-8"?>
+<RDF xmlns="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+ xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+ xmlns:dc="http://purl.org/dc/elements/1.1/"
+ xmlns:dcterms="http://purl.org/dc/terms/">
+    <Description rdf:about="urn:item:1">
+        <dcterms:isPartOf rdf:resource="urn:series:1"/>
+        <dc:description>Number: 12</dc:description>
+    </Description>
+    <Description rdf:about="urn:item:2">
+        <dc:title>Two</dc:title>
+    </Description>
+</RDF>
+"""
+
+
+def test_stream_rewrite_with_default_rdf_namespace(tmp_path):
+    source = tmp_path / "Bibliography.rdf"
+    source.write_text(BIBLIOGRAPHY, encoding="utf-8")
+    out = tmp_path / "out.rdf"
+
+    assert update_bibl_as_rdf.stream_rewrite(str(source), str(out)) == (1, 1, 1)
+
+    lines = out.read_text(encoding="utf-8").splitlines()
+    assert lines[-1] == "</RDF>"
+    top_level = [line for line in lines[2:-1] if not line.startswith("        ")]
+    assert top_level == [
+        '    <Description rdf:about="urn:item:1">',
+        "    </Description>",
+        '    <Description rdf:about="urn:series:1"><dc:identifier>12</dc:identifier></Description>',
+        '    <Description rdf:about="urn:item:2">',
+        "    </Description>",
+    ]
+    g = Graph()
+    g.parse(str(out), format="xml")
+    assert (URIRef("urn:series:1"), DC.identifier, Literal("12")) in g
@@ -0,0 +1,63 @@
+"""Checks for update_printed_books.py. Run from scripts/ with: python3 -m pytest -q"""
+
+import random
+
+import pytest
+
+import update_printed_books as upb
+
+
+def spellings():
+    """A literal statement for each alternative of each gazetteer pattern."""
+    found = []
+    for pattern, _ in upb.PLACE_GAZETTEER:
+        for alt in pattern.split("|"):
+            found.append(alt.replace(r"\b", "").replace(r"\.?", ".").replace(" ?", " "))
+    return found
+
+
+SPELLINGS = spellings()
+
+EDGE_CASES = [
+    "",
+    " ",
+    "s.l.",
+    "nowhere in particular",
+    "imprynted at london",
+    "in thabbey of westmenstre by london",   # Westminster before London
+    "londo westm",                           # gazetteer order, not position
+    "yorke",                                 # \byork\b does not match
+    "new york",
+    "york.",
+    "parisiis",                              # paris and parisi overlap
+    "st andrews and edinburgh",
+    "LONDON",                                # match_place() expects lower case
+    "Westminster by London",
+    "at the signe of the sonne in fletestrete",
+]
+
+
+@pytest.mark.parametrize("statement", SPELLINGS + EDGE_CASES)
+def test_match_place_matches_sequential(statement):
+    assert upb.match_place(statement) == upb.match_place_sequential(statement)
+    low = statement.lower()
+    assert upb.match_place(low) == upb.match_place_sequential(low)
+
+
+def test_spellings_all_match():
+    for spelling in SPELLINGS:
+        assert upb.match_place(spelling) is not None, spelling
+
+
+def test_fuzzed_statements_match_sequential():
+    rng = random.Random(0)
+    filler = ["imprinted", "at", "by", "in", "and", "the", "sold", "[", "]", "?", ",", "sic"]
+    for _ in range(5000):
+        words = rng.sample(SPELLINGS, rng.randint(0, 3)) + rng.sample(filler, rng.randint(0, 4))
+        rng.shuffle(words)
+        statement = rng.choice(["", " "]).join(words)
+        if rng.random() < 0.3:
+            statement = statement.upper()
+        assert upb.match_place(statement) == upb.match_place_sequential(statement), statement
+        assert (upb.extract_place(statement)
+                == upb.extract_place(statement, upb.match_place_sequential)), statement
@@ -0,0 +1,81 @@
+"""Checks for update_records.py. Run from scripts/ with: python3 -m pytest -q"""
+
+import pytest
+from lxml import etree
+
+import update_records
+import corpus
+
+RECORDS = """<?xml version='1.0' encoding='UTF-8'?>
+<?xml-model href="records.rng" type="application/xml"?>
+<records>
+    <record xml:id="record-1">
+        <!-- a note inside the record -->
+        <name>One</name>
+    </record>
+    <!-- between records -->
+    <record xml:id="record-2">
+        <name>Two<?pi inside?></name>
+    </record>
+</records>
+"""
+
+
+@pytest.fixture(autouse=True)
+def private_cache(tmp_path, monkeypatch):
+    """Keep corpus's fingerprints and pickles out of the developer's ../.cache."""
+    cache_dir = tmp_path / ".cache"
+    monkeypatch.setattr(corpus, "CACHE_DIR", cache_dir)
+    monkeypatch.setattr(corpus, "STAMPS", cache_dir / "fingerprints.json")
+    monkeypatch.setattr(corpus, "_stamps", None)
+    monkeypatch.setattr(corpus, "_trees", {})
+    monkeypatch.setattr(corpus, "_results", {})
+    return cache_dir
+
+
+def test_stream_matches_in_memory_with_nested_comments(tmp_path, private_cache):
+    source = tmp_path / "Records.xml"
+    source.write_text(RECORDS, encoding="utf-8")
+    streamed = tmp_path / "streamed.xml"
+    in_memory = tmp_path / "in-memory.xml"
+
+    update_records.stream_records(str(source), str(streamed), [])
+    tree = corpus.load(source)
+    update_records.run_passes(tree.getroot(), [])
+    corpus.write(tree, in_memory)
+
+    out = streamed.read_bytes()
+    assert out == in_memory.read_bytes()
+    assert (private_cache / "fingerprints.json").exists()
+    assert out.count(b"<!-- a note inside the record -->") == 1
+    assert out.index(b"<?xml-model") < out.index(b"<records>") < out.index(b"<!-- a note")
+
+
+WITNESSES = """<records>
+    <record xml:id="record-1">
+        <witness illust="y">
+            <source key="A"/>
+            <facsimiles><facsimile key="B"/><facsimile key="A"/></facsimiles>
+            <editions><edition key="C"/></editions>
+            <ref xml:target="0.12"/>
+        </witness>
+    </record>
+</records>
+"""
+
+
+@pytest.mark.parametrize("names", [
+    ["rename-tags", "facsimiles"],
+    ["facsimiles", "rename-tags"],
+    ["bibl-lists", "facsimiles"],
+    ["facsimiles", "bibl-lists"],
+    ["rename-tags", "bibl-lists"],
+    ["illust", "zero-prefixed-refs", "rename-tags", "bibl-keys"],
+])
+def test_fused_passes_match_sequential(names):
+    fused = etree.fromstring(WITNESSES)
+    update_records.run_passes(fused, update_records.build_passes(names))
+    sequential = etree.fromstring(WITNESSES)
+    for name in names:
+        update_records.run_passes(sequential, update_records.build_passes([name]))
+    assert etree.tostring(fused) == etree.tostring(sequential)
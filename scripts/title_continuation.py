@@ -10,18 +10,23 @@ for manual attention.
 """
 
 from lxml import etree
-import os
 import re
-import json
 import logging
-import difflib
+
+import corpus
+import estc_store
+import marc
+import similarity
 
 SOURCE_FILE = '../../dimev/data/PrintedBooks.xml'
-ESTC_DIR = '../../estc/estc_output/'
 REPORT_FILE = '../artefacts/title_continuation.txt'
 LOG_FILE = '../artefacts/title_continuation.log'
 TEI = '{http://www.tei-c.org/ns/1.0}'
 
+# a title is trimmed when it carries this much of $a and of $b
+A_COVER_MIN = 0.80
+B_COVER_MIN = 0.30
+
 # $a is long or cut mid-clause; trim but flag for manual attention
 REVIEW_TITLES = {"22607", "9983", "9983.3", "20722"}
 
@@ -33,24 +38,6 @@ logging.basicConfig(
 log = logging.getLogger(__name__)
 
 
-def get_idno(monogr, type_):
-    for ref in monogr.findall(TEI + "idno"):
-        if ref.get("type") == type_:
-            return ref.text or ""
-    return ""
-
-
-def norm(s):
-    s = s.lower()
-    s = s.replace("…", " ")
-    s = re.sub(r"\.\.\.", " ", s)
-    s = re.sub(r"\[and\]|\[et\]|&", " and ", s)
-    s = re.sub(r"[\[\]]", "", s)
-    s = re.sub(r"[^\w\s]", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
-
-
 def propose_title(a):
     """The MARC 245 $a, whitespace-normalized and stripped of trailing
     punctuation (DIMEV titles carry none)."""
@@ -59,48 +46,35 @@ def propose_title(a):
     return s
 
 
-def coverage(needle, haystack):
-    """Fraction of `needle` (normalized) that appears, in order, inside
-    `haystack` (normalized), via difflib matching blocks."""
-    if not needle:
-        return 0.0
-    sm = difflib.SequenceMatcher(None, needle, haystack)
-    matched = sum(size for _, _, size in sm.get_matching_blocks())
-    return matched / len(needle)
-
-
 def main():
-    files = set(os.listdir(ESTC_DIR))
-    tree = etree.parse(SOURCE_FILE)
+    tree = corpus.load(SOURCE_FILE)
     root = tree.getroot()
 
     rows = []
     for item in root.findall(TEI + "biblStruct"):
         monogr = item.find(TEI + "monogr")
-        stc = get_idno(monogr, "STC")
+        stc = marc.get_idno(monogr, "STC")
         if not stc:
             continue
-        fn = "STC_" + re.sub(r"\.", "_", stc) + ".json"
-        if fn not in files:
-            continue
-        data = json.load(open(os.path.join(ESTC_DIR, fn)))
-        if data["matching_records"] != 1:
+        data = estc_store.lookup(stc)
+        if data is None or data["matching_records"] != 1:
             continue
         rec = data["records"][0]
         if "130" in rec or "240" in rec or "245" not in rec:
             continue
-        sf = rec["245"][0]["subfields"]
-        a = " ".join(sf.get("a", [])).strip()
-        b = " ".join(sf.get("b", [])).strip()
+        a, b = rec.title_a, rec.title_b
         if not b:                                # no continuation to absorb
             continue
 
         title_el = monogr.find(TEI + "title")
         dimev = re.sub(r"\s+", " ", title_el.text or "").strip()
-        dn, an, bn = norm(dimev), norm(a), norm(b)
+        dn, an, bn = marc.norm(dimev), marc.norm(a), marc.norm(b)
 
-        a_cover = coverage(an, dn)               # is $a present in DIMEV?
-        b_cover = coverage(bn, dn)               # how much of $b is in DIMEV?
+        # coverage() is None below the floor: such a record is no hit, and
+        # needs no alignment, nor any for $b once $a falls short
+        a_cover = similarity.coverage(an, dn, A_COVER_MIN)   # is $a present in DIMEV?
+        b_cover = (similarity.coverage(bn, dn, B_COVER_MIN)  # how much of $b is in DIMEV?
+                   if a_cover is not None else None)
         rows.append({
             "stc": stc, "a_cover": a_cover, "b_cover": b_cover,
             "dimev": dimev, "a": a, "b": b,
@@ -108,7 +82,7 @@ def main():
         })
 
     # only the records that carry $a and meaningfully absorb $b
-    hits = [r for r in rows if r["a_cover"] >= 0.80 and r["b_cover"] >= 0.30]
+    hits = [r for r in rows if r["a_cover"] is not None and r["b_cover"] is not None]
     hits.sort(key=lambda r: -r["b_cover"])
 
     lines = []
@@ -141,8 +115,7 @@ def main():
         else:
             log.info("TRIM    STC%s: -> %r", r["stc"], r["proposed"])
 
-    etree.indent(tree, space="    ", level=0)
-    tree.write(SOURCE_FILE, pretty_print=True, xml_declaration=True, encoding="UTF-8")
+    corpus.write(tree, SOURCE_FILE)
     log.info("Trimmed %d titles to MARC 245 $a (%d flagged for review).",
              len(hits), len(REVIEW_TITLES))
     print("Wrote %s" % SOURCE_FILE)
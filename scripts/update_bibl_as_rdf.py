@@ -1,9 +1,16 @@
 #!/usr/bin/env python3
-from rdflib import Graph, Literal
+from lxml import etree
+from rdflib import BNode, Graph, Literal
 from rdflib.namespace import DC, DCTERMS
+import argparse
+import hashlib
+import os
 import re
 import sys
 from pathlib import Path
+from urllib.parse import urljoin
+
+import corpus
 
 NUMBER_LINE = re.compile(r'(?mi)^\s*Number:\s*(\d+(-\d+)?(,\s+\d+(-\d+)?)*)\s*$')   # capture lines like "Number: 10-11, 13, 200-2"
 
@@ -25,10 +32,12 @@ def extract_numbers_and_clean(text: str):
     cleaned = "".join(kept_lines).strip()
     return numbers, cleaned
 
-def main(infile: str, outfile: str, in_format: str = None, out_format: str = "xml"):
-    g = Graph()
-    g.parse(infile, format=in_format)  # let rdflib sniff format if None
-
+def rewrite_graph(g: Graph):
+    """
+    Returns (descriptions, numbers, resources) counts after rewriting `g` in place:
+    - each dc:description literal loses its 'Number:' lines
+    - each number becomes a dc:identifier of the dcterms:isPartOf target(s)
+    """
     total_descs = 0
     total_numbers = 0
     books_touched = 0
@@ -65,16 +74,270 @@ def main(infile: str, outfile: str, in_format: str = None, out_format: str = "xm
             # (Alternatively: create a new blank node for the series and link it—but that’s a modeling decision.)
             pass
 
-    g.serialize(destination=outfile, format=out_format)
+    return total_descs, total_numbers, books_touched
+
+def report(counts, outfile: str, out_format: str):
+    total_descs, total_numbers, books_touched = counts
     print(f"Descriptions cleaned: {total_descs}")
     print(f"Numbers extracted:   {total_numbers}")
     print(f"Resources annotated (had isPartOf): {books_touched}")
     print(f"Wrote: {outfile} ({out_format})")
 
+# ---------------------------------------------------------------------------
+# Parsed-graph cache
+#
+# Parsing the RDF/XML is most of a run, so the parsed graph is kept as a
+# snapshot -- its triples and namespace bindings, pickled -- in corpus's
+# fingerprint-keyed cache under ../.cache. A run on an unchanged file rebuilds
+# the graph from the snapshot instead of parsing. Relative URIs resolve
+# against the input's location, so the snapshot is also keyed by the resolved
+# path and the format.
+# ---------------------------------------------------------------------------
+
+def parse_snapshot(path, in_format: str = None):
+    """(triples, namespace bindings) of the parsed file."""
+    g = Graph()
+    g.parse(str(path), format=in_format)  # let rdflib sniff format if None
+    return tuple(g), tuple(g.namespaces())
+
+def load_graph(infile: str, in_format: str = None, use_cache: bool = True) -> Graph:
+    """A fresh Graph of `infile`, from the snapshot cache when it is current."""
+    if not use_cache:
+        g = Graph()
+        g.parse(infile, format=in_format)
+        return g
+    source = f"{Path(infile).resolve()}|{in_format}"
+    name = "graph-" + hashlib.sha1(source.encode("utf-8")).hexdigest()[:8]
+    triples, namespaces = corpus.cached(infile, name, lambda path: parse_snapshot(path, in_format), parse=False)
+    g = Graph()
+    for prefix, namespace in namespaces:
+        g.bind(prefix, namespace, override=True, replace=True)
+    g.addN((s, p, o, g) for s, p, o in triples)
+    return g
+
+def main(infile: str, outfile: str, in_format: str = None, out_format: str = "xml", use_cache: bool = True):
+    g = load_graph(infile, in_format, use_cache)
+    counts = rewrite_graph(g)
+    g.serialize(destination=outfile, format=out_format)
+    report(counts, outfile, out_format)
+
+# ---------------------------------------------------------------------------
+# Streaming mode
+#
+# The same rewrite done on the RDF/XML itself, one top-level resource at a
+# time, so memory is bounded by the largest resource rather than the graph.
+# Each top-level element of rdf:RDF is read with iterparse, its dc:description
+# literals cleaned and the numbers added as dc:identifier to the isPartOf
+# targets, and written out before the next is read:
+#   - a nested target (a bib:Series node, or parseType="Resource") gets the
+#     dc:identifier elements inside it;
+#   - a target by reference (rdf:resource, rdf:nodeID) gets them in an
+#     rdf:Description of its own, written after the resource.
+# The output keeps the input's relative URIs, under an xml:base naming the
+# input, so they resolve as they did there. Unlike the graph path, a subject
+# is only linked to the isPartOf targets stated in the same element as its
+# description, as every item in Bibliography.rdf states them.
+# ---------------------------------------------------------------------------
+
+RDF_NS = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+XML_NS = "http://www.w3.org/XML/1998/namespace"
+DESCRIPTION = f"{{{DC}}}description"
+IDENTIFIER = f"{{{DC}}}identifier"
+IS_PART_OF = f"{{{DCTERMS}}}isPartOf"
+PARSE_TYPE = f"{{{RDF_NS}}}parseType"
+XML_LANG = f"{{{XML_NS}}}lang"
+XML_BASE = f"{{{XML_NS}}}base"
+
+def element_base(elem, root_base: str) -> str:
+    """The base URI in effect at `elem`: root_base, refined by xml:base."""
+    bases = [a.get(XML_BASE) for a in elem.iterancestors()][::-1] + [elem.get(XML_BASE)]
+    base = root_base
+    for b in bases:
+        if b is not None:
+            base = urljoin(base, b)
+    return base
+
+def in_scope_lang(elem) -> str:
+    return elem.xpath("string(ancestor-or-self::*[@xml:lang][1]/@xml:lang)")
+
+def add_identifiers(parent, numbers, lang=None):
+    """Append a plain-literal dc:identifier to `parent` for each number.
+    `lang` is the xml:lang the parent will be written under, if not its own."""
+    if lang is None:
+        lang = in_scope_lang(parent)
+    for n in numbers:
+        ident = etree.SubElement(parent, IDENTIFIER)
+        ident.text = n
+        if lang:
+            ident.set(XML_LANG, "")  # an inherited language would tag the literal
+
+def rewrite_resource(top, root_base: str, counts: list):
+    """Rewrite one top-level resource element in place. Returns the
+    rdf:Description elements to write after it, for targets by reference."""
+    referenced = []
+    seen = set()
+    for desc in list(top.iter(DESCRIPTION)):
+        if len(desc) or desc.get(PARSE_TYPE) is not None:
+            continue  # not a plain literal
+        node = desc.getparent()
+        numbers, cleaned = extract_numbers_and_clean(desc.text or "")
+        if not numbers:
+            continue
+
+        # a repeated literal is one triple in the graph: rewrite every copy,
+        # but count it and annotate its series once
+        key = (node, desc.text, in_scope_lang(desc), desc.get(f"{{{RDF_NS}}}datatype"))
+        if cleaned:
+            desc.text = cleaned
+        else:
+            # hand on the whitespace after it, or the next tag moves up a level
+            prev = desc.getprevious()
+            if prev is not None:
+                prev.tail = desc.tail
+            else:
+                node.text = desc.tail
+            node.remove(desc)
+        if key in seen:
+            continue
+        seen.add(key)
+        counts[0] += 1
+        counts[1] += len(numbers)
+
+        series = [p for p in node if p.tag == IS_PART_OF]
+        for part in series:
+            resource = part.get(f"{{{RDF_NS}}}resource")
+            node_id = part.get(f"{{{RDF_NS}}}nodeID")
+            if resource is not None:
+                target = etree.Element(f"{{{RDF_NS}}}Description", nsmap=top.nsmap)
+                target.set(f"{{{RDF_NS}}}about", urljoin(element_base(part, root_base), resource))
+                referenced.append(target)
+                add_identifiers(target, numbers, in_scope_lang(top.getparent()))
+            elif node_id is not None:
+                target = etree.Element(f"{{{RDF_NS}}}Description", nsmap=top.nsmap)
+                target.set(f"{{{RDF_NS}}}nodeID", node_id)
+                referenced.append(target)
+                add_identifiers(target, numbers, in_scope_lang(top.getparent()))
+            elif part.get(PARSE_TYPE) == "Resource":
+                add_identifiers(part, numbers)
+            elif len(part):
+                add_identifiers(part[0], numbers)
+            # else a literal isPartOf, which names no resource to annotate
+        if series:
+            counts[2] += 1
+    return referenced
+
+# A namespace declaration as lxml writes it in a start tag.
+XMLNS_DECL = re.compile(rb' xmlns(?::[\w.-]+)?="[^"]*"')
+
+def serialize(elem, declared: set) -> bytes:
+    """`elem` as an indented line of rdf:RDF's content, less the namespace
+    declarations rdf:RDF already makes: tostring() repeats every one in scope
+    on a resource's start tag."""
+    data = etree.tostring(elem, encoding="utf-8", with_tail=False)
+    end = data.index(b">")  # lxml escapes ">" in attribute values
+    head = XMLNS_DECL.sub(lambda m: b"" if m.group(0) in declared else m.group(0), data[:end])
+    return b"    " + head + data[end:] + b"\n"
+
+def stream_rewrite(infile: str, outfile: str):
+    """The streaming equivalent of main() for RDF/XML input and output.
+    Returns the same (descriptions, numbers, resources) counts."""
+    counts = [0, 0, 0]
+    events = iter(etree.iterparse(infile, events=("start", "end"), remove_comments=True))
+    _, root = next(events)
+
+    # rdf:RDF as in the input, empty, less its closing "/>"
+    root_base = urljoin(Path(os.path.abspath(infile)).as_uri(), root.get(XML_BASE) or "")
+    start = etree.Element(root.tag, dict(root.attrib), nsmap=root.nsmap)
+    start.set(XML_BASE, root_base)
+    start_tag = etree.tostring(start, encoding="utf-8")[:-2] + b">\n"
+    declared = set(XMLNS_DECL.findall(start_tag))
+    name = etree.QName(root).localname
+    if root.prefix is not None:
+        name = f"{root.prefix}:{name}"
+    end_tag = f"</{name}>\n".encode("utf-8")
+
+    with open(outfile, "wb") as out:
+        out.write(b"<?xml version='1.0' encoding='utf-8'?>\n")
+        out.write(start_tag)
+        depth = 1
+        for event, elem in events:
+            if event == "start":
+                depth += 1
+                continue
+            depth -= 1
+            if depth != 1:
+                continue
+            referenced = rewrite_resource(elem, root_base, counts)
+            out.write(serialize(elem, declared))
+            for target in referenced:
+                out.write(serialize(target, declared))
+            # done with this resource: drop it and any before it
+            elem.clear()
+            while elem.getprevious() is not None:
+                del root[0]
+        out.write(end_tag)
+    return tuple(counts)
+
+def canonical_triples(g: Graph):
+    """The triples of `g`, sorted, each blank node replaced by a hash of its
+    neighbourhood, refined until the partition of blank nodes is stable.
+    Two graphs with equal lists are the same up to blank-node labels, short of
+    blank nodes that refinement cannot tell apart, which in this data are
+    copies of each other. (rdflib.compare.isomorphic is exact, but on the
+    bibliography's blank nodes it does not finish.)"""
+    bnodes = {t for triple in g for t in triple if isinstance(t, BNode)}
+    colour = dict.fromkeys(bnodes, "")
+
+    def term(t):
+        return colour[t] if isinstance(t, BNode) else t.n3()
+
+    for _ in range(len(bnodes) + 1):
+        edges = {b: [] for b in bnodes}
+        for s, p, o in g:
+            if isinstance(s, BNode):
+                edges[s].append(("out", p.n3(), term(o)))
+            if isinstance(o, BNode):
+                edges[o].append(("in", term(s), p.n3()))
+        refined = {b: hashlib.sha1(repr((colour[b], sorted(e))).encode("utf-8")).hexdigest()
+                   for b, e in edges.items()}
+        stable = len(set(refined.values())) == len(set(colour.values()))
+        colour = refined
+        if stable:
+            break
+    return sorted((term(s), p.n3(), term(o)) for s, p, o in g)
+
+def verify(infile: str, outfile: str, use_cache: bool = True) -> bool:
+    """Check that the streamed `outfile` holds the same graph as the graph
+    path's result for `infile`."""
+    expected = load_graph(infile, use_cache=use_cache)
+    rewrite_graph(expected)
+    streamed = Graph()
+    streamed.parse(outfile, format="xml")
+    same = canonical_triples(expected) == canonical_triples(streamed)
+    print(f"Same graph as the in-memory rewrite: {same} "
+          f"({len(expected)} and {len(streamed)} triples)")
+    return same
+
 if __name__ == "__main__":
     # Usage:
-    #   python move_number_to_series_identifier.py data/Bibliography.rdf out.rdf
-    inpath = sys.argv[1] if len(sys.argv) > 1 else "../../dimev/data/Bibliography.rdf"
-    outpath = sys.argv[2] if len(sys.argv) > 2 else str(Path(inpath).with_suffix(".out.rdf"))
-    # You can force formats via env or by editing defaults above; otherwise rdflib guesses input; output defaults to RDF/XML.
-    main(inpath, outpath)
+    #   python update_bibl_as_rdf.py data/Bibliography.rdf out.rdf
+    #   python update_bibl_as_rdf.py --stream [--verify] data/Bibliography.rdf out.rdf
+    # The parsed input is cached in ../.cache (see above); --no-cache parses it afresh.
+    # --stream rewrites RDF/XML in one bounded-memory pass (see above);
+    # --verify then checks its output against the in-memory graph rewrite.
+    ap = argparse.ArgumentParser(description="Move 'Number:' lines from dc:description to dc:identifier on the series.")
+    ap.add_argument("infile", nargs="?", default="../../dimev/data/Bibliography.rdf")
+    ap.add_argument("outfile", nargs="?")
+    ap.add_argument("--stream", action="store_true", help="rewrite the RDF/XML as a stream, not as a graph")
+    ap.add_argument("--verify", action="store_true", help="with --stream, check the result against the graph rewrite")
+    ap.add_argument("--no-cache", action="store_true", help="parse the input, ignoring the parsed-graph cache")
+    args = ap.parse_args()
+    outpath = args.outfile or str(Path(args.infile).with_suffix(".out.rdf"))
+    if args.stream:
+        counts = stream_rewrite(args.infile, outpath)
+        report(counts, outpath, "xml")
+        if args.verify and not verify(args.infile, outpath, not args.no_cache):
+            sys.exit(1)
+    else:
+        # You can force formats via env or by editing defaults above; otherwise rdflib guesses input; output defaults to RDF/XML.
+        main(args.infile, outpath, use_cache=not args.no_cache)
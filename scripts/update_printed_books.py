@@ -1,11 +1,15 @@
 #!/usr/bin/env python3
 
 from lxml import etree
-import os
+import argparse
 import re
 import logging
-import json
 import collections
+from concurrent.futures import ProcessPoolExecutor
+
+import corpus
+import estc_store
+import marc
 
 # ---------------------------------------------------------------------------
 # CONFIGURATION
@@ -20,16 +24,20 @@ LOG_FILE = "../artefacts/update_printed_books.log"
 # LOGGING
 # ---------------------------------------------------------------------------
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s  %(levelname)-8s  %(message)s",
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler(LOG_FILE, encoding="utf-8"),
-    ],
-)
 log = logging.getLogger(__name__)
 
+def configure_logging():
+    """Log to the console and to LOG_FILE; called by main(), so that importing
+    this module writes nothing."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s  %(levelname)-8s  %(message)s",
+        handlers=[
+            logging.StreamHandler(),
+            logging.FileHandler(LOG_FILE, encoding="utf-8"),
+        ],
+    )
+
 
 # ---------------------------------------------------------------------------
 # HELPERS
@@ -96,30 +104,54 @@ def restructure_as_tei_biblstruct(root):
 
     return new_tree
 
-def overwrite_from_estc(root):
+def decide_estc(stc_number):
+    """The ESTC side of overwrite_from_estc() for one STC number, worked out
+    without the tree so that it can run in a worker process. None if the
+    download has nothing for the number; else (matching records, ESTC number,
+    place decision), the last two None unless exactly one record matched."""
+    estc_data = estc_store.lookup(stc_number) if stc_number else None
+    if estc_data is None:
+        return None
+    if estc_data["matching_records"] != 1:
+        return estc_data["matching_records"], None, None
+    estc_record = estc_data["records"][0]
+    return 1, estc_record.control_number, decide_pubplace(estc_record)
+
+def estc_decisions(stc_numbers, jobs=1):
+    """decide_estc() for each STC number, yielded in order. With jobs > 1 a
+    pool of worker processes computes them ahead of the caller, which
+    applies each to the tree as it arrives."""
+    if jobs <= 1:
+        yield from map(decide_estc, stc_numbers)
+        return
+    estc_store.load()   # once, before the workers fork
+    chunksize = max(1, len(stc_numbers) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        yield from pool.map(decide_estc, stc_numbers, chunksize=chunksize)
+
+def overwrite_from_estc(root, jobs=1):
     print("Overwriting with ESTC data...\n")
 
-    estc_download_dir = "../../estc/estc_output/"
-    estc_file_list = [f for f in os.listdir(estc_download_dir) if os.path.isfile(os.path.join(estc_download_dir, f))]
     count = 0
     idno_count = 0
     place_tally = collections.Counter()
 
-    for item in root.findall(TEI + "biblStruct"):
+    # Everything read from ESTC is decided up front (in a pool, with jobs >
+    # 1); the tree is changed and the log written here, in document order
+    items = root.findall(TEI + "biblStruct")
+    stc_numbers = [marc.get_idno(item.find(TEI + "monogr"), "STC") for item in items]
+    decisions = estc_decisions(stc_numbers, jobs)
+
+    for item, stc_number, decision in zip(items, stc_numbers, decisions):
         id_ = item.get(NAMESPACE + "id")
         monogr = item.find(TEI + "monogr")
         refs = monogr.findall(TEI + "idno")
         count += 1
         if refs is not None:
-            stc_number = get_idno(refs, "STC")
             if stc_number != "":
-                filename_target = "STC_" + re.sub(r"\.", "_", stc_number) + ".json"
-                if filename_target in estc_file_list:
-                    path = os.path.join(estc_download_dir, filename_target)
-                    with open(path) as f:
-                        estc_data = json.load(f)
-                    if estc_data["matching_records"] == 1:
-                        estc_record = estc_data["records"][0]
+                if decision is not None:
+                    matching_records, estc_number, place_decision = decision
+                    if matching_records == 1:
 
                         # add ESTC number after the STC number (idno precedes
                         # imprint, per the TEI content model for monogr)
@@ -133,7 +165,7 @@ def overwrite_from_estc(root):
                             estc_el = etree.Element(TEI + "idno")
                             estc_el.set("type", "ESTC")
                             stc_el.addnext(estc_el)
-                        estc_el.text = estc_record["001"][0]
+                        estc_el.text = estc_number
                         idno_count += 1
 
                         # NOTE: titles were replaced from MARC 130/240 in a
@@ -154,9 +186,8 @@ def overwrite_from_estc(root):
 
                         # add place of printing from MARC 260 $a, normalized
                         # to a standard modern name via the gazetteer
-                        update_pubplace(monogr, estc_record, id_, place_tally)
+                        apply_pubplace(monogr, place_decision, id_, place_tally)
                     else:
-                        matching_records = estc_data["matching_records"]
                         log.warning("Found %d matching records for item %s. Skipping.", matching_records, id_)
                 else:
                     log.warning("No ESTC data found for item %s. Skipping.", id_)
@@ -230,16 +261,11 @@ def extract_date(estc_record):
     When extraction is not confident, text is the 260 $c statement, lightly
     normalized, with no attributes."""
 
-    f008 = estc_record.get("008", [""])[0]
-    date_type = f008[6:7]
-    date1 = f008[7:11]
-    date2 = f008[11:15].strip()
+    date_type = estc_record.date_type
+    date1 = estc_record.date1
+    date2 = estc_record.date2
 
-    statement = ""
-    if "260" in estc_record:
-        c_values = estc_record["260"][0]["subfields"].get("c")
-        if c_values:
-            statement = c_values[0]
+    statement = estc_record.date_statement
     fallback = re.sub(r"[\[\]]", "", statement)
     fallback = re.sub(r"\s+", " ", fallback).strip().strip(",.;: ")
 
@@ -318,12 +344,6 @@ DROP_ESTC_AUTHOR = {
     "Jesus Christ",
 }
 
-def marc_subfield_a(field):
-    """The $a of the first instance of a MARC name field, with the trailing
-    cataloguer's punctuation stripped."""
-    a = field[0]["subfields"].get("a", [""])
-    return a[0].strip().strip(".,").strip() if a else ""
-
 def update_author(monogr, estc_record, id_, tally):
     """Overwrite the DIMEV <author> with ESTC's personal-name main entry
     (MARC 100 $a), subject to the KEEP/DROP lists. Records each action under a
@@ -340,14 +360,14 @@ def update_author(monogr, estc_record, id_, tally):
 
     # only personal names (MARC 100); corporate main entries (110) do not
     # serve as authors here
-    if not estc_record.get("100"):
+    if "100" not in estc_record:
         tally["CORPORATE/none (skipped)"] += 1
-        if estc_record.get("110"):
+        if "110" in estc_record:
             log.info("CORP    %s: ESTC main entry is corporate %r; left unchanged",
-                     id_, marc_subfield_a(estc_record["110"]))
+                     id_, estc_record.main_entry("110"))
         return
 
-    name = marc_subfield_a(estc_record["100"])
+    name = estc_record.main_entry("100")
     if not name:
         tally["CORPORATE/none (skipped)"] += 1
         return
@@ -400,7 +420,31 @@ PLACE_GAZETTEER = [
     (r"\bscotland\b", "Scotland"),
 ]
 
-def extract_place(statement):
+# The gazetteer as one pattern, compiled once. Each entry sits in a lookahead
+# anchored at the start of the statement, so the alternation tries them in
+# gazetteer order and the first entry found anywhere wins, as it would in a
+# loop of re.search() calls; the named group says which entry matched.
+PLACE_MATCHER = re.compile(
+    "|".join(r"(?=.*?(?P<place%d>%s))" % (i, pattern)
+             for i, (pattern, _) in enumerate(PLACE_GAZETTEER)),
+    re.DOTALL,
+)
+PLACE_NAMES = {"place%d" % i: name for i, (_, name) in enumerate(PLACE_GAZETTEER)}
+
+def match_place(low):
+    """The gazetteer name for a lower-cased place statement, or None."""
+    m = PLACE_MATCHER.match(low)
+    return PLACE_NAMES[m.lastgroup] if m else None
+
+def match_place_sequential(low):
+    """match_place() the slow way, one re.search() per gazetteer entry; kept
+    as the reference for test_update_printed_books.py."""
+    for pattern, name in PLACE_GAZETTEER:
+        if re.search(pattern, low):
+            return name
+    return None
+
+def extract_place(statement, match=match_place):
     """Normalize a transcribed place statement (MARC 260 $a) to a standard
     modern place name. Returns (text, cert, confident): cert is True when ESTC
     marks the place conjectural ("?"); when no gazetteer entry matches, text is
@@ -415,27 +459,41 @@ def extract_place(statement):
     if re.fullmatch(r"s\.?\s*l\.?", low):
         return "S.l.", False, True
 
-    for pattern, name in PLACE_GAZETTEER:
-        if re.search(pattern, low):
-            return name, cert, True
+    name = match(low)
+    if name is not None:
+        return name, cert, True
     return s, cert, False
 
+def decide_pubplace(estc_record):
+    """What update_pubplace() does for this record, short of the tree:
+    ("no 260", None, None), ("no $a", None, None), or ("place", the 260 $a,
+    its extract_place() result)."""
+    if "260" not in estc_record:
+        return "no 260", None, None
+    if estc_record.place is None:
+        return "no $a", None, None
+    return "place", estc_record.place, extract_place(estc_record.place)
+
 def update_pubplace(monogr, estc_record, id_, tally):
     """Insert (or refresh) a <pubPlace> in <imprint>, before <publisher>, from
     the normalized MARC 260 $a. Records each action under a category in
     `tally` and logs the noteworthy ones."""
+    apply_pubplace(monogr, decide_pubplace(estc_record), id_, tally)
 
-    if "260" not in estc_record:
+def apply_pubplace(monogr, decision, id_, tally):
+    """The tree and log side of update_pubplace(), given decide_pubplace()."""
+
+    status, statement, parsed = decision
+    if status == "no 260":
         tally["no 260 (skipped)"] += 1
         log.info("NOPLACE %s: no MARC 260; pubPlace not added", id_)
         return
-    a_values = estc_record["260"][0]["subfields"].get("a")
-    if not a_values:
+    if status == "no $a":
         tally["no $a (skipped)"] += 1
         log.info("NOPLACE %s: no MARC 260 $a; pubPlace not added", id_)
         return
 
-    text, cert, confident = extract_place(a_values[0])
+    text, cert, confident = parsed
 
     imprint = monogr.find(TEI + "imprint")
     pubplace = imprint.find(TEI + "pubPlace")
@@ -451,32 +509,31 @@ def update_pubplace(monogr, estc_record, id_, tally):
     if not confident:
         tally["LOW (unmatched)"] += 1
         log.warning("LOWPLACE %s: no gazetteer match for %r; wrote %r",
-                    id_, a_values[0], text)
+                    id_, statement, text)
     else:
         tally[text + (" (cert)" if cert else "")] += 1
 
-def get_idno(refs, target_att_type):
-    ref_number = ""
-    for ref in refs:
-        if ref.get("type") == target_att_type:
-            ref_number = ref.text
-            break
-    return ref_number
-
 # ---------------------------------------------------------------------------
 # MAIN
 # ---------------------------------------------------------------------------
 
 def main():
-    tree = etree.parse(SOURCE_FILE)
+    ap = argparse.ArgumentParser(description="Update PrintedBooks.xml from the ESTC download.")
+    ap.add_argument("--jobs", type=int, default=1,
+                    help="worker processes deciding the ESTC updates ahead of the tree pass "
+                         "(default: %(default)s; the decisions are cheap, so a pool pays "
+                         "only on a large download with cores to spare)")
+    args = ap.parse_args()
+    configure_logging()
+
+    tree = corpus.load(SOURCE_FILE)
     root = tree.getroot()
 
     # tree = restructure_as_tei_biblstruct(root)
-    overwrite_from_estc(root)
+    overwrite_from_estc(root, args.jobs)
 
     print('All transformations complete')
-    etree.indent(tree, space="    ", level=0)
-    tree.write(SOURCE_FILE, pretty_print=True, xml_declaration=True, encoding='UTF-8')
+    corpus.write(tree, SOURCE_FILE)
     print(f'Wrote the revised tree to {SOURCE_FILE}')
 
 if __name__ == "__main__":
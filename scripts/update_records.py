@@ -1,8 +1,16 @@
 from lxml import etree
+import argparse
+import contextlib
 import csv
-import copy
+import hashlib
+import json
+import mmap
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor
+
+import corpus
+import record_index
 
 # Top-level variables
 
@@ -14,118 +22,268 @@ form_crosswalk_csv = '../artefacts/form-terms.csv'
 namespace = '{http://www.w3.org/XML/1998/namespace}'
 
 # Variables for atomization
-#output_dir = '../../dimev/data/records'
-#cross_ref_output_file = os.path.join(output_dir, 'cross_references.xml')
+output_dir = '../../dimev/data/records'
+cross_ref_output_file = 'cross_references.xml'
+manifest_file = 'manifest.json'
+
+# Bad keys in <mss> references, with their corrections
+BIBL_KEY_CROSSWALK = {
+    ('BodEngPoed27', 'BodEngPoetd27'),
+    ('STC2996.7', 'STC29967'),
+    ('CoventryAcc351', 'CovAcc351'),
+    ('HM127', 'HunHM127'),
+    ('OxfLin52', 'OxfLinLat52'),
+    ('BLLan704', 'BLLan204'),
+    ('CamFitz41-1950', 'CamFitz41-1951')
+        }
+
+# Tags renamed in the conversion from DIMEV 1.0
+DIMEV1_TAG_CROSSWALK = [
+        ('insc', 'mss'),
+        ('biblio', 'bibl'),
+        ('edition', 'bibl'),
+        ('facsimile', 'bibl'),
+        ('language', 'term'),
+        ('subject', 'term'),
+        ('verseForm', 'term'),
+        ('versePattern', 'term')
+        ]
+
+# Passes, by command-line name. Each entry builds the pass (loading any
+# crosswalks) and returns a dict with any of these hooks:
+#   'tags'   -- {tag: handler}, each handler called with every element of that tag
+#   'record' -- called with each top-level <record>, after the pass's tag handlers
+#   'finish' -- called once after the last record, to report tallies
+#   'local'  -- True if each tag handler reads and changes only the element it
+#               is given (its tag, attributes and text), never its children,
+#               parent or siblings
+# The engine applies every selected pass in a single traversal of the tree:
+# each record is visited once and its passes run in command-line order, with
+# the tag handlers of consecutive local passes sharing one walk of the record.
+PASSES = {
+    'rename-tags': lambda: rename_tags_pass(DIMEV1_TAG_CROSSWALK),
+    'imev-etc': lambda: imev_etc_pass(),
+    'bibl-lists': lambda: bibl_lists_pass(),
+    'combine-forms': lambda: combine_forms_pass(),
+    'illust': lambda: illust_pass(),
+    'ref-elements': lambda: ref_elements_pass(),
+    'compare-alpha': lambda: compare_alpha_pass(),
+    'extract-refs': lambda: extract_refs_pass(),
+    'imev-from-desc': lambda: imev_from_desc_pass(),
+    'zero-prefixed-refs': lambda: zero_prefixed_refs_pass(),
+    'bibl-keys': lambda: bibl_keys_pass(['mss'], BIBL_KEY_CROSSWALK),
+    'facsimiles': lambda: facsimiles_pass(),
+    'subjects': lambda: subjects_pass(),
+    'verseForms': lambda: verseForms_pass(),
+    'misplaced-forms': lambda: misplaced_forms_pass(),
+    'post1500': lambda: post1500_term_pass(),
+    'prose': lambda: prose_term_pass(),
+    'mec-refs': lambda: mec_refs_pass(),
+    'mec-restructure': lambda: mec_restructure_pass(),
+}
+
+# Named sequences of passes
+PASS_GROUPS = {
+    # convert from DIMEV 1.0
+    'dimev1': ['rename-tags', 'imev-etc', 'bibl-lists', 'combine-forms', 'illust', 'ref-elements'],
+}
 
 def main():
-    tree = etree.parse(source_file)
-    root = tree.getroot()  # root element <records>
-
-    ## convert from DIMEV 1.0
-    #convert_from_dimev1(root)
-
-    ## Compare name and alpha strings
-    #compare_name_and_alpha(root)
-
-    ## Extract refs to crossRef element
-    #root = extract_refs(root)
-
-    ## Extract IMEV numbers from free text descriptions
-    #root = extract_imev_numbers_from_desc(root)
-
-    ## rewrite zero-prefixed refs as bibliographic citations
-    #root = transform_zero_prefixed_refs(root)
-
-    ## Fix bibl keys
-    #target_tags = ['mss']
-    #crosswalk = {
-    #    ('BodEngPoed27', 'BodEngPoetd27'),
-    #    ('STC2996.7', 'STC29967'),
-    #    ('CoventryAcc351', 'CovAcc351'),
-    #    ('HM127', 'HunHM127'),
-    #    ('OxfLin52', 'OxfLinLat52'),
-    #    ('BLLan704', 'BLLan204'),
-    #    ('CamFitz41-1950', 'CamFitz41-1951')
-    #        }
-    #root = replace_bibl_keys(root, target_tags, crosswalk)
-
-    ## Rebuild the facsimiles element
-    #root = update_facsimiles(root)
-
-    ## Update subjects
-    #root = update_subjects(root)
-
-    ## Update forms
-    #root = update_verseForms(root)
-
-    ## Move formal terms misplaced in subjects
-    #root = move_misplaced_form_terms(root)
-
-    ## Create C16 term from nimev values
-    #root = add_post1500_as_term(root)
+    parser = argparse.ArgumentParser(description='Transform Records.xml in place, applying the named passes in one traversal.')
+    parser.add_argument('passes', nargs='*', metavar='PASS',
+                        help=f'passes to apply, in order (choices: {", ".join(list(PASSES) + list(PASS_GROUPS))})')
+    parser.add_argument('--stream', action='store_true',
+                        help='stream the file, holding one record in memory at a time')
+    parser.add_argument('--output', help='write here instead of overwriting the source file')
+    parser.add_argument('--dry-run', action='store_true', help='apply the passes but write nothing (and skip --atomize)')
+    parser.add_argument('--atomize', nargs='?', const=output_dir, metavar='DIR',
+                        help='after any passes, write one file per record to DIR (default: %(const)s)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help='worker processes for --atomize (default: %(default)s)')
+    args = parser.parse_args()
+    if not args.passes and not args.atomize:
+        parser.error('name at least one pass, or --atomize')
+    for name in args.passes:
+        if name not in PASSES and name not in PASS_GROUPS:
+            parser.error(f'unknown pass: {name}')
+
+    if args.passes:
+        apply_passes(args)
+    if args.atomize:
+        if args.dry_run:
+            # the passes' output was never written, so there is nothing to atomize
+            print(f'Dry run; not atomizing to {args.atomize}.')
+        else:
+            atomize_records(args.output or source_file, args.atomize, args.jobs)
 
-    ## Create a verseForm term for items deleted by NIMEV as prose
-    #root = add_prose_as_term(root)
+def apply_passes(args):
+    passes = build_passes(args.passes)
+    dest = args.output or source_file
 
-    ## Add ME Compendium as repertory
-    #root = add_mec_refs(root)
+    if args.stream:
+        stream_records(source_file, os.devnull if args.dry_run else dest, passes)
+        return
 
-    # Restructure MEC references
-    restructure_mec_refs(root)
+    tree = corpus.load(source_file)
+    root = tree.getroot()  # root element <records>
+    run_passes(root, passes)
 
     print('All transformations complete')
-    etree.indent(tree, space="    ", level=0)
-    tree.write(source_file, pretty_print=True, xml_declaration=True, encoding='UTF-8')
-    print(f'Wrote the revised tree to {source_file}')
-
-def convert_from_dimev1(root):
-    print('Converting from DIMEV 1.0...\n')
-
-    # rename tags
-    crosswalk = [
-            ('insc', 'mss'),
-            ('biblio', 'bibl'),
-            ('edition', 'bibl'),
-            ('facsimile', 'bibl'),
-            ('language', 'term'),
-            ('subject', 'term'),
-            ('verseForm', 'term'),
-            ('versePattern', 'term')
-            ]
-    root = rename_tags(root, crosswalk)
-
-    # Create repertories and populate with IMEV, NIMEV, and Ringler
-    root = extract_imev_etc(root)
-
-    # restructure bibliographic lists
-    root = restructure_bibl_lists(root)
-
-    # Combine form terms
-    root = combine_form_terms(root)
-
-    # convert `illust` and `music` to boolean values
-    root = convert_illust(root)
-
-    # Reformat ref elements
-    root = reformat_ref_elements(root)
-
+    if args.dry_run:
+        print('Dry run; nothing written.')
+        return
+    corpus.write(tree, dest)
+    print(f'Wrote the revised tree to {dest}')
+
+def build_passes(names):
+    passes = []
+    for name in names:
+        for member in PASS_GROUPS.get(name, [name]):
+            passes.append(PASSES[member]())
+    return passes
+
+def plan_stages(passes):
+    # Split the passes into the stages applied to each record, so that every
+    # pass sees the record as the passes before it left it. The tag handlers
+    # of consecutive local passes are merged into one walk: a handler that
+    # touches only its own element cannot tell whether a later pass has
+    # already visited an ancestor. A pass that restructures gets a walk of its
+    # own, as does a record hook.
+    stages = []
+    fusable = False
+    for pass_ in passes:
+        if 'tags' in pass_:
+            local = pass_.get('local', False)
+            if local and fusable:
+                stages[-1][1].append(pass_['tags'])
+            else:
+                stages.append(('tags', [pass_['tags']]))
+            fusable = local
+        if 'record' in pass_:
+            stages.append(('record', pass_['record']))
+            fusable = False
+    return stages
+
+def transform_record(elem, stages):
+    for kind, stage in stages:
+        if kind == 'record':
+            if elem.tag == 'record':
+                stage(elem)
+        else:
+            walk_tags(elem, stage)
+
+def walk_tags(elem, handler_maps):
+    # The walk is over a snapshot of the elements with a handled tag, so
+    # handlers may rename or restructure. A renamed element is offered to the
+    # later passes under its new tag; elements created by a handler are not
+    # visited.
+    wanted = set()
+    for handlers in handler_maps:
+        wanted.update(handlers)
+    for node in list(elem.iter(*wanted)):
+        for handlers in handler_maps:
+            handler = handlers.get(node.tag)
+            if handler is not None:
+                handler(node)
+
+def finish_passes(passes):
+    for pass_ in passes:
+        if 'finish' in pass_:
+            pass_['finish']()
+
+def run_passes(root, passes):
+    stages = plan_stages(passes)
+    for elem in root:
+        if isinstance(elem.tag, str):
+            transform_record(elem, stages)
+    finish_passes(passes)
     return root
 
-def convert_illust(root):
+def stream_records(source, dest, passes):
+    # Apply the passes without loading the whole tree: each top-level element
+    # is parsed, transformed, written to `dest` and freed, so peak memory is
+    # one record. Comments and processing instructions outside the records are
+    # copied through. The output matches what the in-memory path writes (same
+    # indentation), and `dest` may be the source file itself: the result goes
+    # to a temporary file that replaces `dest` when complete.
+    print(f'Streaming {source}...')
+    stages = plan_stages(passes)
+    to_devnull = dest == os.devnull
+    tmp = dest if to_devnull else str(dest) + '.tmp'
+    count = 0
+    depth = 0
+    xf = None
+    context = etree.iterparse(source, events=('start', 'end', 'comment', 'pi'))
+    with open(tmp, 'wb') as fh, contextlib.ExitStack() as stack:
+        fh.write(b"<?xml version='1.0' encoding='UTF-8'?>\n")
+        for event, elem in context:
+            if event == 'start':
+                if depth == 0:
+                    xf = stack.enter_context(etree.xmlfile(fh, encoding='UTF-8'))
+                    stack.enter_context(xf.element(elem.tag, dict(elem.attrib), nsmap=elem.nsmap))
+                depth += 1
+            elif event == 'end':
+                depth -= 1
+                if depth == 1:
+                    transform_record(elem, stages)
+                    if elem.tag == 'record':
+                        count += 1
+                    write_top_level(xf, elem)
+                    release(elem)
+                elif depth == 0:
+                    xf.write('\n')
+                    stack.close()
+            elif depth == 1:
+                # comment or PI between records
+                write_top_level(xf, elem)
+                release(elem)
+            elif depth == 0:
+                # prolog or epilog, e.g. the xml-model PI
+                if xf is not None:
+                    fh.write(b'\n')
+                fh.write(etree.tostring(elem, encoding='UTF-8', with_tail=False))
+                if xf is None:
+                    fh.write(b'\n')
+            # a comment or PI inside a record is left to its record, which
+            # write_top_level() serializes whole
+        fh.write(b'\n')
+    if not to_devnull:
+        os.replace(tmp, dest)
+    finish_passes(passes)
+    print(f'Streamed {count} records to {dest}')
+
+def write_top_level(xf, elem):
+    if isinstance(elem.tag, str):
+        etree.indent(elem, space='    ', level=1)
+    elem.tail = None
+    xf.write('\n    ')
+    xf.write(elem)
+
+def release(elem):
+    # free the written element and any siblings already written before it
+    elem.clear()
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
+
+def illust_pass():
     print('Converting `illust` and `music` to Boolean values...')
     attr_list = ['music', 'illust']
     permitted_values = ['true', 'false']
     count = 0
-    for witness in root.iter('witness'):
+    def witness_handler(witness):
+        nonlocal count
         for attr_name in attr_list:
             attr_val = witness.get(attr_name)
             if attr_val is not None and attr_val not in permitted_values:
                 bool_val = convert_to_bool(attr_val)
                 witness.set(attr_name, bool_val)
                 count += 1
-    print(f'Converted {count} attribute values.')
-    print('Done.\n')
-    return root
+    def finish():
+        print(f'Converted {count} attribute values.')
+        print('Done.\n')
+    return {'tags': {'witness': witness_handler}, 'finish': finish, 'local': True}
 
 def convert_to_bool(str_):
     if str_ == 'y':
@@ -136,10 +294,11 @@ def convert_to_bool(str_):
         print(f'WARNING: unexpected value: {str_}')
     return str_
 
-def reformat_ref_elements(root):
+def ref_elements_pass():
     print('Reformatting ref elements...')
     count = 0
-    for ref in root.iter('ref'):
+    def ref_handler(ref):
+        nonlocal count
 
         # Strip text content. The text content was checked against xml:target
         # in a previous step
@@ -163,15 +322,16 @@ def reformat_ref_elements(root):
             ref.set('target', target)
             ref.attrib.pop(namespace + 'target')
             count += 1
+    def finish():
+        print(f'Restructured {count} elements')
+        print('Done.\n')
+    return {'tags': {'ref': ref_handler}, 'finish': finish, 'local': True}
 
-    print(f'Restructured {count} elements')
-    print('Done.\n')
-    return root
-
-def compare_name_and_alpha(root):
+def compare_alpha_pass():
     test_count = 0
     error_count = 0
-    for record in root.findall('record'):
+    def record_hook(record):
+        nonlocal test_count, error_count
         test_count += 1
         alpha = record.find('alpha')
         alpha_str = str(alpha.text)
@@ -194,12 +354,15 @@ def compare_name_and_alpha(root):
         if not re.match(alpha_str.lower(), name_str.lower()):
             error_count += 1
             print(f'Strings do not match ({error_count}/{test_count}):\n\t{name_str}\n\t{alpha_str}')
-    print(f'\nFound {error_count} non-matching strings')
+    def finish():
+        print(f'\nFound {error_count} non-matching strings')
+    return {'record': record_hook, 'finish': finish}
 
-def extract_refs(root):
+def extract_refs_pass():
     print('Extracting ref values and writing to the crossRef block...')
     count = 0
-    for record in root.findall('record'):
+    def record_hook(record):
+        nonlocal count
         if record.find('witnesses') is None: # limit to record stubs, for now
             desc = record.find('description')
             note = record.find('descNote')
@@ -214,9 +377,10 @@ def extract_refs(root):
                         count += 1
             if len(targets) > 0:
                 record = add_crossrefs(record, targets)
-    print(f'Found {count} cross-references')
-    print('Done\n')
-    return root
+    def finish():
+        print(f'Found {count} cross-references')
+        print('Done\n')
+    return {'record': record_hook, 'finish': finish}
 
 def format_target_val(string):
     if '#' in string:
@@ -252,10 +416,11 @@ def add_crossrefs(record, new_targets):
             crossRefs.append(item)
     return record
 
-def extract_imev_numbers_from_desc(root):
+def imev_from_desc_pass():
     print('Extracting IMEV and Supplement numbers from content of description and descNote elements...')
     count = 0
-    for record in root.findall('record'):
+    def record_hook(record):
+        nonlocal count
         desc = record.find('description')
         note = record.find('descNote')
         pattern = r'[Ff]ormer(ly)? (\d+(\.\d)?)'
@@ -276,14 +441,16 @@ def extract_imev_numbers_from_desc(root):
                     item.append(citation)
                     record = add_repertory(record, item)
                     count += 1
-    print(f'Found {count} matches and wrote corresponding repertory elements')
-    print('Done\n')
-
+    def finish():
+        print(f'Found {count} matches and wrote corresponding repertory elements')
+        print('Done\n')
+    return {'record': record_hook, 'finish': finish}
 
-def transform_zero_prefixed_refs(root):
+def zero_prefixed_refs_pass():
     print('Converting ref elements with zero-prefixed values into bibliographic references to IMEV and Supplement...')
     count = 0
-    for elem in root.iter('ref'):
+    def ref_handler(elem):
+        nonlocal count
         ref = elem.get(namespace + 'target', '')
         pattern = r'0\.'
         if re.match(pattern, ref):
@@ -295,28 +462,30 @@ def transform_zero_prefixed_refs(root):
             else:
                 elem.set('key', 'Brown1943')
             count += 1
-    print(f'Converted {count} ref elements')
-    print('Done\n')
-    return root
+    def finish():
+        print(f'Converted {count} ref elements')
+        print('Done\n')
+    return {'tags': {'ref': ref_handler}, 'finish': finish, 'local': True}
 
-def restructure_bibl_lists(root):
+def bibl_lists_pass():
     target_tags = ['editions', 'facsimiles']
     print(f'Restructuring the blocks {", ".join(target_tags)}...')
     count = 0
-    for elem in root.iter():
-        if elem.tag in target_tags:
-            # Check whether the new structure is already implemented
-            child = elem[0]
-            if isinstance(child.tag, str) and child.tag != 'item':
-                parent = elem.getparent()
-                index = parent.index(elem)
-                new_elem = add_intermediate_element_and_rename_child(elem, 'item', 'bibl')
-                parent.insert(index, new_elem)
-                parent.remove(elem)
-                count += 1
-    print(f'Restructured {count} blocks.')
-    print('Done\n')
-    return root
+    def list_handler(elem):
+        nonlocal count
+        # Check whether the new structure is already implemented
+        child = elem[0]
+        if isinstance(child.tag, str) and child.tag != 'item':
+            parent = elem.getparent()
+            index = parent.index(elem)
+            new_elem = add_intermediate_element_and_rename_child(elem, 'item', 'bibl')
+            parent.insert(index, new_elem)
+            parent.remove(elem)
+            count += 1
+    def finish():
+        print(f'Restructured {count} blocks.')
+        print('Done\n')
+    return {'tags': {tag: list_handler for tag in target_tags}, 'finish': finish}
 
 def add_intermediate_element_and_rename_child(old_elem, intermediate_element_tag_name, new_tag_name):
     new_elem = etree.Element(old_elem.tag)
@@ -326,22 +495,26 @@ def add_intermediate_element_and_rename_child(old_elem, intermediate_element_tag
         new_elem.append(middle_elem)
     return new_elem
 
-def rename_tags(root, crosswalk):
+def rename_tags_pass(crosswalk):
+    handlers = {}
     count = 0
-    for item_pair in crosswalk:
-        print(f'Renaming {item_pair[0]} as {item_pair[1]}...')
-        for elem in root.iter():
-            if elem.tag == item_pair[0]:
-                elem.tag = item_pair[1]
-                count += 1
-    print(f'Renamed {count} tags.')
-    print('Done\n')
-    return root
+    for old_tag, new_tag in crosswalk:
+        print(f'Renaming {old_tag} as {new_tag}...')
+        def rename(elem, new_tag=new_tag):
+            nonlocal count
+            elem.tag = new_tag
+            count += 1
+        handlers[old_tag] = rename
+    def finish():
+        print(f'Renamed {count} tags.')
+        print('Done\n')
+    return {'tags': handlers, 'finish': finish, 'local': True}
 
-def combine_form_terms(root):
+def combine_forms_pass():
     print('Merging "versePatterns" into "verseForms" and deleting "versePatterns"...')
     count = 0
-    for record in root.findall('record'):
+    def record_hook(record):
+        nonlocal count
         # Define objects
         verseForms = record.find('verseForms')
         versePatterns = record.find('versePatterns')
@@ -362,24 +535,26 @@ def combine_form_terms(root):
             # Prune empty verseForms elements
             if not len(verseForms):
                 record.remove(verseForms)
-    print(f'Merged and deleted {count} "versePatterns" blocks')
-    print('Done\n')
-    return root
+    def finish():
+        print(f'Merged and deleted {count} "versePatterns" blocks')
+        print('Done\n')
+    return {'record': record_hook, 'finish': finish}
 
-def replace_bibl_keys(root, target_tags, crosswalk):
+def bibl_keys_pass(target_tags, crosswalk):
     print('Replacing bad keys...')
     count = 0
-    for elem in root.iter():
-        if elem.tag in target_tags:
-            key = elem.get('key')
-            for keypair in crosswalk:
-                if key == keypair[0]:
-                    elem.set('key', keypair[1])
-                    count += 1
-                    break
-    print(f'Updated {count} keys.')
-    print('Done\n')
-    return root
+    def key_handler(elem):
+        nonlocal count
+        key = elem.get('key')
+        for keypair in crosswalk:
+            if key == keypair[0]:
+                elem.set('key', keypair[1])
+                count += 1
+                break
+    def finish():
+        print(f'Updated {count} keys.')
+        print('Done\n')
+    return {'tags': {tag: key_handler for tag in target_tags}, 'finish': finish, 'local': True}
 
 def strip_tag(parent, tagname):
     # print(f'Stripping {tagname} tags from the content of {parent}')
@@ -400,7 +575,7 @@ def strip_tag(parent, tagname):
     # print('Done\n')
     return parent
 
-def update_facsimiles(root):
+def facsimiles_pass():
     print('Rebuilding facsimile elements, omitting keys for on-line facsimiles of whole manuscripts...')
 
     # These keys have been checked individually. Facs links are supplied for
@@ -429,7 +604,8 @@ def update_facsimiles(root):
 
     count = 0
     count2 = 0
-    for witness in root.iter('witness'):
+    def witness_handler(witness):
+        nonlocal count, count2
         source = witness.find('source')
         source_key = source.get('key')
         old_facs_elem = witness.find('facsimiles')
@@ -447,9 +623,10 @@ def update_facsimiles(root):
             if len(new_facs_elem):
                 witness.insert(index, new_facs_elem)
             witness.remove(old_facs_elem)
-    print(f'Found {count} facsimile elements with keys identical to source keys and {count2} other facsimile elements to be deleted')
-    print('Done\n')
-    return root
+    def finish():
+        print(f'Found {count} facsimile elements with keys identical to source keys and {count2} other facsimile elements to be deleted')
+        print('Done\n')
+    return {'tags': {'witness': witness_handler}, 'finish': finish}
 
 def process_mec(mec_source):
     tree = etree.parse(mec_source)
@@ -465,12 +642,13 @@ def process_mec(mec_source):
             mec_to_dimev_xwalk.append(xwalk_item)
     return mec_to_dimev_xwalk
 
-def add_mec_refs(root):
+def mec_refs_pass():
     print('Creating Middle English Compendium-to-DIMEV crosswalk...')
     mec_to_dimev_xwalk = process_mec(mec_source)
     print('Adding references to Middle English Compendium Bibliography as repertory...')
     count = 0
-    for record in root.findall('record'):
+    def record_hook(record):
+        nonlocal count
         dimev_id = record.get(namespace + 'id')
         if dimev_id is not None:
             dimev_id = re.sub('record-', '', dimev_id)
@@ -480,36 +658,42 @@ def add_mec_refs(root):
                     new_repertory.text = item[0]
                     record = add_repertory(record, new_repertory)
                     count += 1
-    print(f'Added {count} references to the Middle English Compendium Bibliography')
-    print('Done\n')
-    return root
+    def finish():
+        print(f'Added {count} references to the Middle English Compendium Bibliography')
+        print('Done\n')
+    return {'record': record_hook, 'finish': finish}
 
-def restructure_mec_refs(root):
+def mec_restructure_pass():
     print("Restructuring MEC references")
-    for ref in root.findall("record/repertories/item/bibl"):
-        if ref.get("key") == "MECompendium":
-            del ref.attrib["key"]
-            ref.set("target", "https://quod.lib.umich.edu/m/middle-english-dictionary/bibliography/" + ref.text)
-            ref.text = None
-            ref.tag = "ref"
-
-def add_prose_as_term(root):
+    def record_hook(record):
+        for ref in record.findall("repertories/item/bibl"):
+            if ref.get("key") == "MECompendium":
+                del ref.attrib["key"]
+                ref.set("target", "https://quod.lib.umich.edu/m/middle-english-dictionary/bibliography/" + ref.text)
+                ref.text = None
+                ref.tag = "ref"
+    return {'record': record_hook}
+
+def prose_term_pass():
     print('Applying "prose, according to NIMEV" as form term, extracted from values of the "nimev" attribute...')
     count = 0
-    for record in root.findall('record'):
+    def record_hook(record):
+        nonlocal count
         nimev = record.get('nimev', '')
         if 'prose' in nimev and record.find('witnesses') is not None: # Exclude cross-refs
             record = update_forms(record, 'prose, according to NIMEV')
             count += 1
-    print(f'Tagged {count} items as "prose, according to NIMEV"')
-    print('Done\n')
-    return root
+    def finish():
+        print(f'Tagged {count} items as "prose, according to NIMEV"')
+        print('Done\n')
+    return {'record': record_hook, 'finish': finish}
 
-def add_post1500_as_term(root):
+def post1500_term_pass():
     post1500_strings = {'TP', 'TM', 'C16', 'C 19', 'Dubar', 'Dunbar', 'post-1500', 'post medieval', 'post-medieval', 'Skelton'}
     print('Applying "post-1500" as subject term, extracted from values of the "nimev" attribute...')
     count = 0
-    for record in root.findall('record'):
+    def record_hook(record):
+        nonlocal count
         nimev = record.get('nimev', '')
         c16 = False
         for term in post1500_strings:
@@ -520,16 +704,17 @@ def add_post1500_as_term(root):
             subjects_element = record.find('subjects')
             subjects_element = add_unique_terms(subjects_element, 'subject', 'post-1500')
             count += 1
-    print(f'Tagged {count} items as post-1500')
-    print('Done\n')
-    return root
+    def finish():
+        print(f'Tagged {count} items as post-1500')
+        print('Done\n')
+    return {'record': record_hook, 'finish': finish}
 
-def update_verseForms(root):
+def verseForms_pass():
     print('Updating form terms...')
     print('Creating crosswalk from current terms to revised terms...')
     deleted_terms, term_crosswalk = create_term_crosswalk(form_crosswalk_csv)
     print('Implementing the crosswalk...')
-    for record in root.findall('record'):
+    def record_hook(record):
         old_verseForms = record.find('verseForms')
         if old_verseForms is not None:
             new_verseForms = etree.Element('verseForms')
@@ -538,15 +723,14 @@ def update_verseForms(root):
             if len(new_verseForms):
                 record.insert(index, new_verseForms)
             record.remove(old_verseForms)
-    print('Done\n')
-    return root
+    return {'record': record_hook, 'finish': lambda: print('Done\n')}
 
-def update_subjects(root):
+def subjects_pass():
     print('Updating subject terms...')
     print('Creating crosswalk from current subject terms to revised subject terms...')
     deleted_subjects, subject_crosswalk = create_term_crosswalk(subject_crosswalk_csv)
     print('Implementing the crosswalk...')
-    for record in root.findall('record'):
+    def record_hook(record):
         old_subjects_element = record.find('subjects')
         if old_subjects_element is not None:
             subjects_index = record.index(old_subjects_element)
@@ -554,8 +738,7 @@ def update_subjects(root):
             new_subjects = implement_term_crosswalk(new_subjects, old_subjects_element, deleted_subjects, subject_crosswalk, 'subject')
             record.insert(subjects_index, new_subjects)
             record.remove(old_subjects_element)
-    print('Done\n')
-    return root
+    return {'record': record_hook, 'finish': lambda: print('Done\n')}
 
 def implement_term_crosswalk(new_term_block, old_term_block, deleted_terms, term_crosswalk, tagname):
     for child in old_term_block:
@@ -581,11 +764,11 @@ def implement_term_crosswalk(new_term_block, old_term_block, deleted_terms, term
                 print(f'WARNING: term "{old_term}" not found in cross-walk. This term will be deleted.')
     return new_term_block
 
-def move_misplaced_form_terms(root):
+def misplaced_forms_pass():
     print('Moving formal terms misplaced as subject terms...')
     list_of_formal_terms = get_formal_terms_misplaced_as_subjects(subject_categories_csv)
     print('NOTE: review items tagged with the verseForm "ballade". Not all are the fixed form.')
-    for record in root.findall('record'):
+    def record_hook(record):
         new_subjects = etree.Element('subjects')
         old_subjects_element = record.find('subjects')
         if old_subjects_element is not None:
@@ -597,8 +780,7 @@ def move_misplaced_form_terms(root):
                     new_subjects.append(child)
             record.insert(subjects_index, new_subjects)
             record.remove(old_subjects_element)
-    print('Done\n')
-    return root
+    return {'record': record_hook, 'finish': lambda: print('Done\n')}
 
 def update_forms(record, form_term):
 
@@ -684,10 +866,11 @@ def remove_alpha(record):
         record.remove(alpha)
     return record
 
-def extract_imev_etc(root):
+def imev_etc_pass():
     print('Extracting NIMEV and IMEV references to child element repertories...')
     count = 0
-    for record in root.findall('record'):
+    def record_hook(record):
+        nonlocal count
         # @imev and @nimev values that map to no repertory
         junk_values = {'', 'n', 'C16', 'C 19', 'delete', 'delete C16', 'delete: C16', 'delete: prose', 'Dubar', 'Dunbar (?)', 'Dunbar', 'not ME', 'Old English', 'post-1500', 'post medieval', 'post-medieval', 'prose', 'Skelton'}
         dimev_id = record.get(namespace + 'id')
@@ -744,9 +927,10 @@ def extract_imev_etc(root):
                     repertory = etree.Element('repertory', key=attr)
                     repertory.text = value
                     record = add_repertory(record, repertory)
-    print(f'Converted {count} attributes.')
-    print('Done\n')
-    return root
+    def finish():
+        print(f'Converted {count} attributes.')
+        print('Done\n')
+    return {'record': record_hook, 'finish': finish}
 
 def add_repertory(record, new_repertory):
     citation = new_repertory.find('bibl')
@@ -784,48 +968,120 @@ def validate_numeric(value, dimev_id):
 
 def create_output_dir(output_dir):
     if not os.path.exists(output_dir):
-        os.makedir(output_dir)
+        os.makedirs(output_dir)
+
+def atomize_records(source, output_dir, jobs=None):
+    # Write each full record to its own file in output_dir, named by
+    # format_id(), and collect the cross-references (records with no
+    # <witnesses>) in one file, per Documentation 2.2.1 and 2.2.3. The record
+    # list comes from the byte-offset index, split into contiguous shards, and
+    # each worker process parses and serializes its own shard. A file whose
+    # content hash matches the manifest of the previous run is left alone, so
+    # re-atomizing after a small edit rewrites only the records touched.
+    print(f'Atomizing {source} to {output_dir}...')
+    create_output_dir(output_dir)
+    manifest_path = os.path.join(output_dir, manifest_file)
+    old_manifest = load_manifest(manifest_path)
+    spans = record_index.load_index(source)['spans']
+
+    jobs = max(1, jobs or 1)
+    shard_size = max(1, -(-len(spans) // (jobs * 4)))
+    shards = [spans[i:i + shard_size] for i in range(0, len(spans), shard_size)]
+    old_records = old_manifest['records']
+    tasks = [(source, output_dir, shard, {xml_id: old_records[xml_id] for _, _, xml_id in shard if xml_id in old_records})
+             for shard in shards]
+    if jobs == 1:
+        results = [atomize_shard(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(atomize_shard, tasks))
 
-def atomize_records():
-    # Iterate over each 'record' element in the original tree
-    record_count = 0
-    cross_ref_count = 0
+    manifest = {'source': str(source), 'records': {}}
     cross_refs = etree.Element('records') # Create a new root for cross-references
-    for record in root.findall('record'):
-
-        # If the <record> element has no child-element <witnesses>, the <record>
-        # element is a cross-reference. These are handled differently from 'full'
-        # record elements, per Documentation 2.2.1 and 2.2.3.  NOTE: I'm unsure
-        # whether the deepcopy is necessary.
-
-        if record.find('witnesses') is None:
-            new_record = process_record(copy.deepcopy(record))
-            cross_refs.append(new_record)
-            cross_ref_count += 1
-        else:
-            # Retrieve the xml:id attribute.
-            xml_id = record.get(namespace + 'id')
-            if xml_id is None:
-                print("Record without xml:id, skipping.")
-                continue
+    record_count = 0
+    written_count = 0
+    for shard_result in results:
+        for kind, xml_id, value in shard_result:
+            if kind == 'cross_ref':
+                cross_refs.append(etree.fromstring(value))
+            elif kind == 'no_id':
+                print('Record without xml:id, skipping.')
             else:
-                # Create a new tree containing a deep copy of the current record.
-                # Again, I'm unsure whether the deepcopy is needed.
-                new_record = process_record(copy.deepcopy(record))
-                new_tree = etree.ElementTree(new_record)
-                # Construct a file name using the xml:id attribute.
-                formatted_id = format_id(xml_id)
-                file_name = os.path.join(output_dir, f"{formatted_id}.xml")
-                # Write the new tree to a file.
-                new_tree.write(file_name, pretty_print=True, xml_declaration=True, encoding='UTF-8')
-            record_count += 1
-
-    print(f'Wrote {record_count} full records to {output_dir}')
+                path, sha256, written = value
+                manifest['records'][xml_id] = {'path': path, 'sha256': sha256}
+                record_count += 1
+                written_count += written
+    print(f'Wrote {written_count} of {record_count} full records to {output_dir} ({record_count - written_count} unchanged)')
+
+    # Remove files of records no longer in the source
+    current_paths = {entry['path'] for entry in manifest['records'].values()}
+    for entry in old_manifest['records'].values():
+        if entry['path'] not in current_paths:
+            stale = os.path.join(output_dir, entry['path'])
+            if os.path.exists(stale):
+                os.remove(stale)
+                print(f'Removed {stale}')
 
     # Create a new ElementTree for the cross references and write to a file.
-    new_tree = etree.ElementTree(cross_refs)
-    new_tree.write(cross_ref_output_file, pretty_print=True, xml_declaration=True, encoding='UTF-8')
-    print(f"Wrote {cross_ref_count} cross references to {cross_ref_output_file}")
+    data = etree.tostring(cross_refs, pretty_print=True, xml_declaration=True, encoding='UTF-8')
+    sha256 = hashlib.sha256(data).hexdigest()
+    cross_ref_path = os.path.join(output_dir, cross_ref_output_file)
+    if not is_unchanged(cross_ref_path, sha256, len(data), old_manifest.get('cross_references')):
+        with open(cross_ref_path, 'wb') as file:
+            file.write(data)
+    manifest['cross_references'] = {'path': cross_ref_output_file, 'sha256': sha256, 'count': len(cross_refs)}
+    print(f"Wrote {len(cross_refs)} cross references to {cross_ref_path}")
+
+    with open(manifest_path, 'w') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    print(f'Wrote manifest to {manifest_path}')
+
+def atomize_shard(task):
+    # Worker: parse and serialize the records in one shard. Returns, in
+    # document order, ('record', xml_id, (path, sha256, written)) for full
+    # records, ('cross_ref', xml_id, bytes) for cross-references and
+    # ('no_id', None, None) for full records without an xml:id.
+    source, output_dir, shard, old_records = task
+    results = []
+    with open(source, 'rb') as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        for start, end, xml_id in shard:
+
+            # If the <record> element has no child-element <witnesses>, the
+            # <record> element is a cross-reference. These are handled
+            # differently from 'full' record elements.
+
+            record = etree.fromstring(buf[start:end])
+            if record.find('witnesses') is None:
+                results.append(('cross_ref', xml_id, buf[start:end]))
+            elif xml_id is None:
+                results.append(('no_id', None, None))
+            else:
+                data = etree.tostring(record, pretty_print=True, xml_declaration=True, encoding='UTF-8')
+                sha256 = hashlib.sha256(data).hexdigest()
+                # Construct a file name using the xml:id attribute.
+                path = f"{format_id(xml_id)}.xml"
+                file_name = os.path.join(output_dir, path)
+                written = not is_unchanged(file_name, sha256, len(data), old_records.get(xml_id))
+                if written:
+                    with open(file_name, 'wb') as file:
+                        file.write(data)
+                results.append(('record', xml_id, (path, sha256, written)))
+    return results
+
+def is_unchanged(file_name, sha256, size, old_entry):
+    # True if the manifest records this content for the file and the file
+    # is still in place
+    return (old_entry is not None
+            and old_entry['sha256'] == sha256
+            and os.path.exists(file_name)
+            and os.path.getsize(file_name) == size)
+
+def load_manifest(manifest_path):
+    try:
+        with open(manifest_path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {'records': {}}
 
 def format_id(xml_id):
     # DIMEV ids are numerals in the range 1-6889, with two optional decimal
@@ -839,4 +1095,5 @@ def format_id(xml_id):
         xml_id = '0' * difference + xml_id
     return xml_id
 
-main()
+if __name__ == '__main__':
+    main()